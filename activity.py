@@ -0,0 +1,70 @@
+import atexit
+import logging
+from datetime import datetime
+from threading import Lock
+from time import monotonic
+import sqlalchemy as sa
+from app import app, db
+from models import Visitor
+
+logger = logging.getLogger(__name__)
+
+# Seconds between last-seen writes per worker process
+LAST_SEEN_FLUSH_INTERVAL = 300
+
+class LastSeenTracker:
+    """Buffers visitors' last-seen times in memory and writes them in batches.
+    
+    Requests only record the visitor id; the buffered times are written in a
+    single executemany UPDATE at most once per interval. Anything buffered
+    when the process exits is flushed then.
+    """
+
+    def __init__(self, interval=LAST_SEEN_FLUSH_INTERVAL):
+        self.interval = interval
+        self._pending = {}
+        self._lock = Lock()
+        self._last_flush = monotonic()
+
+    def touch(self, visitor_id):
+        """Record that a visitor was seen now"""
+        seen = datetime.now()
+        # Under the lock flush swaps the dict with, so no touch lands in a swapped-out dict
+        with self._lock:
+            self._pending[visitor_id] = seen
+
+    def flush_if_due(self):
+        if monotonic() - self._last_flush >= self.interval:
+            self.flush()
+
+    def flush(self):
+        """Write all buffered last-seen times"""
+        with self._lock:
+            pending, self._pending = self._pending, {}
+            self._last_flush = monotonic()
+        if not pending:
+            return
+
+        visitors = Visitor.__table__
+        try:
+            # Own connection, so the request's session state is never committed here
+            with db.engine.begin() as conn:
+                conn.execute(
+                    visitors.update()
+                    .where(visitors.c.id == sa.bindparam('visitor_id'))
+                    .values(last_visit=sa.bindparam('seen')),
+                    [{'visitor_id': visitor_id, 'seen': seen} for visitor_id, seen in pending.items()]
+                )
+        except Exception as e:
+            logger.error(f"Error writing last-seen times: {str(e)}")
+
+last_seen = LastSeenTracker()
+
+@app.teardown_request
+def flush_last_seen(exc):
+    last_seen.flush_if_due()
+
+@atexit.register
+def flush_last_seen_at_exit():
+    with app.app_context():
+        last_seen.flush()
@@ -1,12 +1,12 @@
 import os
-import logging
 from flask import Flask
 from flask_sqlalchemy import SQLAlchemy
 from sqlalchemy.orm import DeclarativeBase
 from werkzeug.middleware.proxy_fix import ProxyFix
+from logging_config import configure_logging
 
-# Configure logging
-logging.basicConfig(level=logging.DEBUG)
+# Configure logging (level, format and sampling come from the environment)
+configure_logging()
 
 class Base(DeclarativeBase):
     pass
@@ -24,8 +24,9 @@ app.config["SQLALCHEMY_ENGINE_OPTIONS"] = {
     "pool_recycle": 300,
 }
 
-# Initialize SQLAlchemy
-db = SQLAlchemy(model_class=Base)
+# Initialize SQLAlchemy. Objects stay loaded after a commit, so a request
+# can keep using its visitor without reading the row back.
+db = SQLAlchemy(model_class=Base, session_options={'expire_on_commit': False})
 db.init_app(app)
 
 # Create tables
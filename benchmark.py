@@ -0,0 +1,225 @@
+import os
+import sys
+import json
+import random
+import argparse
+import tempfile
+import threading
+from time import perf_counter
+from datetime import date, timedelta
+from uuid import uuid4
+from concurrent.futures import ThreadPoolExecutor
+
+BROWSER_USER_AGENT = 'Mozilla/5.0 (X11; Linux x86_64) gita-daily-benchmark'
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Seed a database with synthetic visitors and drive the app through the daily cycle"
+    )
+    parser.add_argument('--visitors', type=int, default=200, help="Number of synthetic visitors (default 200)")
+    parser.add_argument('--weeks', type=int, default=4, help="Weeks of history to seed per visitor (default 4)")
+    parser.add_argument('--concurrency', type=int, default=1, help="Visitors driven in parallel threads (default 1)")
+    parser.add_argument('--seed', type=int, default=1, help="Random seed for the synthetic data (default 1)")
+    parser.add_argument('--database-url', help="Throwaway database to seed instead of a temporary SQLite file; "
+                                               "any SQLAlchemy URL such as postgresql://...")
+    parser.add_argument('--json', action='store_true', help="Print the report as JSON")
+    return parser.parse_args(argv)
+
+def seed(visitors, weeks, rng):
+    """Insert synthetic visitors with `weeks` of daily history ending yesterday.
+
+    Returns the (visitor id, session id) pairs.
+    """
+    from app import db
+    from corpus import get_corpus
+    from models import Visitor, VisitorShloka, DailyProgress, Favorite, Quiz, ReviewState, ProgressYear
+    from history import bitmap_rows, compute_streaks
+
+    corpus = get_corpus()
+    today = date.today()
+    days = weeks * 7
+    accounts = []
+    visitor_rows, shloka_rows, progress_rows, favorite_rows, quiz_rows, review_rows = [], [], [], [], [], []
+    year_rows = []
+
+    for _ in range(visitors):
+        visitor_id, session_id = str(uuid4()), str(uuid4())
+        accounts.append((visitor_id, session_id))
+        start = rng.randrange(len(corpus))
+        ordinal = start - 1
+        last_quiz_date = None
+        seen = []
+        completed = []
+
+        for offset in range(days, 0, -1):
+            day = today - timedelta(days=offset)
+            batch = corpus.next_after(ordinal, 5)
+            ordinal = batch[-1].ordinal
+            shloka_rows.extend({'visitor_id': visitor_id, 'shloka_id': v.id, 'date': day} for v in batch)
+            seen.extend(batch)
+            progress_rows.append({'visitor_id': visitor_id, 'date': day, 'completed': rng.random() < 0.8})
+            if progress_rows[-1]['completed']:
+                completed.append(day)
+            if day.weekday() == 6:
+                quiz_rows.append({'visitor_id': visitor_id, 'date': day, 'completed': True, 'score': rng.randrange(0, 101)})
+                last_quiz_date = day
+                # Quizzed verses get review states, some already due
+                review_rows.extend({
+                    'visitor_id': visitor_id, 'shloka_id': v.id, 'easiness': 2.5, 'interval': 6,
+                    'repetitions': 2, 'due_date': today + timedelta(days=rng.randrange(-7, 8)), 'last_reviewed': day,
+                } for v in {v.id: v for v in rng.sample(seen[-35:], min(7, len(seen)))}.values())
+
+        year_rows.extend(bitmap_rows(visitor_id, completed))
+        current_streak, longest_streak, last_completed = compute_streaks(completed)
+        favorite_rows.extend(
+            {'visitor_id': visitor_id, 'shloka_id': v.id}
+            for v in rng.sample(list(corpus), min(10, len(corpus)))
+        )
+        visitor_rows.append({
+            'id': visitor_id,
+            'session_id': session_id,
+            'last_shloka_date': today - timedelta(days=1) if days else None,
+            'shloka_cursor': ordinal if days else None,
+            'notification_time': f"{rng.randrange(6, 22):02d}:00",
+            'last_quiz_date': last_quiz_date,
+            'current_streak': current_streak,
+            'longest_streak': longest_streak,
+            'last_completed_date': last_completed,
+        })
+
+    for model, rows in ((Visitor, visitor_rows), (VisitorShloka, shloka_rows), (DailyProgress, progress_rows),
+                        (Favorite, favorite_rows), (Quiz, quiz_rows), (ReviewState, review_rows),
+                        (ProgressYear, year_rows)):
+        for i in range(0, len(rows), 5000):
+            db.session.execute(db.insert(model), rows[i:i + 5000])
+    db.session.commit()
+    return accounts
+
+class Recorder:
+    """Collects latency and query count per endpoint across threads"""
+
+    def __init__(self):
+        self.samples = {}
+        self._lock = threading.Lock()
+
+    def add(self, name, seconds, queries):
+        with self._lock:
+            self.samples.setdefault(name, []).append((seconds, queries))
+
+def _percentile(sorted_values, fraction):
+    index = min(len(sorted_values) - 1, max(0, int(round(fraction * len(sorted_values))) - 1))
+    return sorted_values[index]
+
+def run_visitor(app, account, recorder, query_counts, rng):
+    """Drive one visitor through a day: read, favorite, complete, check progress, take the quiz"""
+    visitor_id, session_id = account
+    client = app.test_client()
+    client.environ_base['HTTP_USER_AGENT'] = BROWSER_USER_AGENT
+    with client.session_transaction() as session:
+        session['session_id'] = session_id
+        session['visitor_id'] = visitor_id
+
+    def call(name, method, path, **kwargs):
+        query_counts.value = 0
+        started = perf_counter()
+        response = client.open(path, method=method, **kwargs)
+        elapsed = perf_counter() - started
+        if response.status_code >= 400:
+            raise RuntimeError(f"{name} returned {response.status_code}")
+        recorder.add(name, elapsed, query_counts.value)
+        return response
+
+    call('GET /dashboard', 'GET', '/dashboard')
+    bootstrap = call('GET /api/dashboard/bootstrap', 'GET', '/api/dashboard/bootstrap')
+    call('GET /api/dashboard/bootstrap (304)', 'GET', '/api/dashboard/bootstrap',
+         headers={'If-None-Match': bootstrap.headers['ETag']})
+    shlokas = bootstrap.get_json()['shlokas']
+    call('POST /api/favorites/toggle', 'POST', '/api/favorites/toggle', json={'shloka_id': rng.choice(shlokas)['id']})
+    call('GET /api/favorites', 'GET', '/api/favorites')
+    # Returns the updated progress, so the dashboard doesn't fetch /api/progress
+    call('POST /api/shlokas/mark-complete', 'POST', '/api/shlokas/mark-complete',
+         json={'reviewed': [s['id'] for s in shlokas if s['isReview']]})
+    quiz = call('POST /api/quiz/generate', 'POST', '/api/quiz/generate').get_json()
+    answers = {str(q['id']): rng.choice(q['options'])['id'] for q in quiz['questions']}
+    call('POST /api/quiz/submit', 'POST', '/api/quiz/submit', json={'quiz_id': quiz['quiz_id'], 'answers': answers})
+
+def report(recorder, wall_time):
+    total = sum(len(s) for s in recorder.samples.values())
+    endpoints = {}
+    for name, samples in recorder.samples.items():
+        latencies = sorted(s[0] for s in samples)
+        queries = [s[1] for s in samples]
+        endpoints[name] = {
+            'requests': len(samples),
+            'p50_ms': round(_percentile(latencies, 0.50) * 1000, 2),
+            'p99_ms': round(_percentile(latencies, 0.99) * 1000, 2),
+            'queries_mean': round(sum(queries) / len(queries), 2),
+            'queries_max': max(queries),
+        }
+    return {
+        'requests': total,
+        'seconds': round(wall_time, 3),
+        'requests_per_second': round(total / wall_time, 1) if wall_time else None,
+        'endpoints': endpoints,
+    }
+
+def print_report(result):
+    print(f"{result['requests']} requests in {result['seconds']}s ({result['requests_per_second']} req/s)")
+    print(f"{'endpoint':<36} {'requests':>8} {'p50 ms':>8} {'p99 ms':>8} {'queries':>8} {'max':>5}")
+    for name, row in result['endpoints'].items():
+        print(f"{name:<36} {row['requests']:>8} {row['p50_ms']:>8} {row['p99_ms']:>8} "
+              f"{row['queries_mean']:>8} {row['queries_max']:>5}")
+
+def main(argv=None):
+    args = parse_args(argv)
+    workdir = None
+    if args.database_url:
+        os.environ['DATABASE_URL'] = args.database_url
+    else:
+        workdir = tempfile.TemporaryDirectory()
+        os.environ['DATABASE_URL'] = 'sqlite:///' + os.path.join(workdir.name, 'benchmark.db')
+    os.environ.setdefault('LOG_LEVEL', 'WARNING')
+
+    # Import only once DATABASE_URL points at the benchmark database
+    from flask import g
+    from app import app, db
+    from activity import last_seen
+    import main as server  # noqa: F401 -- registers routes and runs startup.prepare()
+
+    query_counts = threading.local()
+
+    @app.after_request
+    def capture_query_count(response):
+        query_counts.value = g.get('metrics_queries', 0)
+        return response
+
+    rng = random.Random(args.seed)
+    with app.app_context():
+        accounts = seed(args.visitors, args.weeks, rng)
+
+    recorder = Recorder()
+    started = perf_counter()
+    with ThreadPoolExecutor(max_workers=max(1, args.concurrency)) as pool:
+        seeds = [rng.random() for _ in accounts]
+        futures = [
+            pool.submit(run_visitor, app, account, recorder, query_counts, random.Random(s))
+            for account, s in zip(accounts, seeds)
+        ]
+        for future in futures:
+            future.result()
+    result = report(recorder, perf_counter() - started)
+
+    if args.json:
+        print(json.dumps(result, indent=2))
+    else:
+        print_report(result)
+    with app.app_context():
+        # Write buffered last-seen times now rather than at exit, after the database is gone
+        last_seen.flush()
+        db.engine.dispose()
+    if workdir is not None:
+        workdir.cleanup()
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,202 @@
+import os
+import pickle
+import logging
+from collections import OrderedDict
+from fnmatch import fnmatchcase
+from functools import wraps
+from threading import Lock
+from time import monotonic
+from flask import Response, make_response
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_TTL = 300
+DEFAULT_MAXSIZE = 1024
+# Keys deleted per command when clearing a shared cache
+CLEAR_BATCH_SIZE = 500
+
+class LRUCache:
+    """In-process cache with per-entry expiry and least-recently-used eviction"""
+
+    def __init__(self, maxsize=DEFAULT_MAXSIZE):
+        self.maxsize = maxsize
+        self._entries = OrderedDict()
+        self._lock = Lock()
+
+    def get(self, key):
+        """Return (hit, value) for a key"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return False, None
+            expires_at, value = entry
+            if expires_at <= monotonic():
+                del self._entries[key]
+                return False, None
+            self._entries.move_to_end(key)
+            return True, value
+
+    def set(self, key, value, ttl):
+        with self._lock:
+            self._entries[key] = (monotonic() + ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def keys(self):
+        with self._lock:
+            return list(self._entries)
+
+class SharedCache:
+    """Cache stored in a shared key/value service, so all workers see the same entries.
+
+    `client` needs Redis-style get(key), setex(key, ttl, value), delete(*keys)
+    and scan_iter(match, count); values are pickled. LocalClient is an in-memory stand-in
+    for running without the real service.
+    """
+
+    def __init__(self, client, prefix='gita-daily:'):
+        self.client = client
+        self.prefix = prefix
+
+    def get(self, key):
+        raw = self.client.get(self.prefix + key)
+        if raw is None:
+            return False, None
+        return True, pickle.loads(raw)
+
+    def set(self, key, value, ttl):
+        self.client.setex(self.prefix + key, max(1, int(ttl)), pickle.dumps(value))
+
+    def delete(self, key):
+        self.client.delete(self.prefix + key)
+
+    def clear(self):
+        """Delete this cache's entries, leaving any other keys in the database alone"""
+        batch = []
+        for key in self.client.scan_iter(match=self.prefix + '*', count=CLEAR_BATCH_SIZE):
+            batch.append(key)
+            if len(batch) >= CLEAR_BATCH_SIZE:
+                self.client.delete(*batch)
+                batch = []
+        if batch:
+            self.client.delete(*batch)
+
+class LocalClient:
+    """In-memory stand-in for a Redis client, for local runs and tests"""
+
+    def __init__(self):
+        self._store = LRUCache(maxsize=DEFAULT_MAXSIZE * 16)
+
+    def get(self, key):
+        return self._store.get(key)[1]
+
+    def setex(self, key, ttl, value):
+        self._store.set(key, value, ttl)
+
+    def delete(self, *keys):
+        for key in keys:
+            self._store.delete(key)
+
+    def scan_iter(self, match='*', count=None):
+        return (key for key in self._store.keys() if fnmatchcase(key, match))
+
+def create_backend():
+    """Pick the cache backend from CACHE_URL: a redis:// URL, 'local' for the stand-in, or in-process by default"""
+    url = os.environ.get('CACHE_URL', '')
+    if url == 'local':
+        return SharedCache(LocalClient())
+    if url.startswith(('redis://', 'rediss://')):
+        try:
+            import redis
+        except ImportError:
+            logger.warning("CACHE_URL is set but the redis package is not installed; using in-process cache")
+        else:
+            return SharedCache(redis.Redis.from_url(url))
+    return LRUCache()
+
+backend = create_backend()
+
+# Hit and miss counts per cached function
+stats = {}
+
+def _count(name, outcome):
+    counters = stats.setdefault(name, {'hits': 0, 'misses': 0})
+    counters[outcome] += 1
+
+def _lookup(name, cache_key):
+    try:
+        hit, value = backend.get(cache_key)
+    except Exception as e:
+        logger.warning(f"Cache read failed for {name}: {str(e)}")
+        return False, None
+    _count(name, 'hits' if hit else 'misses')
+    return hit, value
+
+def _store(name, cache_key, value, ttl):
+    try:
+        backend.set(cache_key, value, ttl)
+    except Exception as e:
+        logger.warning(f"Cache write failed for {name}: {str(e)}")
+
+def _cache_key(name, key, args, kwargs):
+    suffix = key(*args, **kwargs) if key else repr((args, sorted(kwargs.items())))
+    return f"{name}:{suffix}"
+
+def cached(ttl=DEFAULT_TTL, key=None):
+    """Cache a function's return value for `ttl` seconds.
+    
+    key builds the cache key from the call's arguments; by default it is
+    their repr.
+    """
+    def decorator(fn):
+        name = f"{fn.__module__}.{fn.__qualname__}"
+
+        @wraps(fn)
+        def wrapped(*args, **kwargs):
+            cache_key = _cache_key(name, key, args, kwargs)
+            hit, value = _lookup(name, cache_key)
+            if hit:
+                return value
+            value = fn(*args, **kwargs)
+            _store(name, cache_key, value, ttl)
+            return value
+        return wrapped
+    return decorator
+
+def cached_view(ttl=DEFAULT_TTL, key=None, unless=None):
+    """Cache a view's successful responses for `ttl` seconds.
+    
+    unless is called per request and bypasses the cache when it returns
+    true, e.g. for requests that carry visitor state. Responses are stored
+    as body, status and headers and rebuilt fresh on every hit, so later
+    response hooks never see a shared object.
+    """
+    def decorator(view):
+        name = f"{view.__module__}.{view.__qualname__}"
+
+        @wraps(view)
+        def wrapped(*args, **kwargs):
+            if unless is not None and unless():
+                return view(*args, **kwargs)
+
+            cache_key = _cache_key(name, key, args, kwargs)
+            hit, value = _lookup(name, cache_key)
+            if hit:
+                data, status, headers = value
+                return Response(data, status=status, headers=headers)
+
+            response = make_response(view(*args, **kwargs))
+            if response.status_code == 200 and not response.direct_passthrough:
+                _store(name, cache_key, (response.get_data(), response.status_code, list(response.headers.items())), ttl)
+            return response
+        return wrapped
+    return decorator
@@ -0,0 +1,153 @@
+import os
+import sys
+import random
+import argparse
+import tempfile
+from benchmark import BROWSER_USER_AGENT, seed
+
+# Maximum SQL statements per request, in the order the requests are made.
+# Raise a budget only together with the change that needs it.
+BUDGETS = {
+    'anonymous daily shlokas': 0,
+    'anonymous landing page': 0,
+    'search': 0,
+    'daily shlokas, new visitor': 6,
+    'daily shlokas, first visit of the day': 5,
+    'daily shlokas, repeat visit': 3,
+    'daily shlokas, not modified': 1,
+    'dashboard bootstrap, first visit of the day': 6,
+    'dashboard bootstrap, repeat visit': 4,
+    'dashboard bootstrap, not modified': 1,
+    'toggle favorite': 4,
+    'favorites': 2,
+    'mark complete': 6,
+    'progress': 2,
+    'progress, not modified': 1,
+    'notification time': 1,
+    'generate quiz': 7,
+    'submit quiz': 7,
+    'submit quiz again': 2,
+}
+
+class QueryCounter:
+    """Counts statements sent to the database while active"""
+
+    def __init__(self):
+        self.count = 0
+        self.statements = []
+
+    def __call__(self, conn, cursor, statement, parameters, context, executemany):
+        self.count += 1
+        self.statements.append(' '.join(statement.split())[:120])
+
+    def reset(self):
+        self.count = 0
+        self.statements = []
+
+def run_checks():
+    """Make each budgeted request once and return the (name, queries, budget, statements) results"""
+    from sqlalchemy import event
+    from app import app, db
+    import main as server  # noqa: F401 -- registers routes and runs startup.prepare()
+
+    counter = QueryCounter()
+    with app.app_context():
+        (visitor_id, session_id), (dashboard_visitor_id, dashboard_session_id) = seed(2, 2, random.Random(1))
+        event.listen(db.engine, 'before_cursor_execute', counter)
+
+    results = []
+
+    def check(client, name, method, path, **kwargs):
+        counter.reset()
+        response = client.open(path, method=method, **kwargs)
+        if response.status_code >= 400:
+            raise RuntimeError(f"{name}: {method} {path} returned {response.status_code}")
+        results.append((name, counter.count, BUDGETS[name], counter.statements))
+        return response
+
+    # A client that has no session yet, e.g. one that hasn't loaded a page
+    anonymous = app.test_client()
+    check(anonymous, 'anonymous daily shlokas', 'GET', '/api/shlokas/daily')
+    check(anonymous, 'anonymous landing page', 'GET', '/')
+    check(anonymous, 'search', 'GET', '/api/shlokas/search?q=krishna')
+    # Loading the page started a session, so the next daily call creates the visitor
+    check(anonymous, 'daily shlokas, new visitor', 'GET', '/api/shlokas/daily')
+
+    def visitor_client(visitor_id, session_id):
+        client = app.test_client()
+        client.environ_base['HTTP_USER_AGENT'] = BROWSER_USER_AGENT
+        with client.session_transaction() as session:
+            session['session_id'] = session_id
+            session['visitor_id'] = visitor_id
+        return client
+
+    # A second visitor opens the dashboard, which loads everything in one request
+    dashboard = visitor_client(dashboard_visitor_id, dashboard_session_id)
+    check(dashboard, 'dashboard bootstrap, first visit of the day', 'GET', '/api/dashboard/bootstrap')
+    bootstrap = check(dashboard, 'dashboard bootstrap, repeat visit', 'GET', '/api/dashboard/bootstrap')
+    check(dashboard, 'dashboard bootstrap, not modified', 'GET', '/api/dashboard/bootstrap',
+          headers={'If-None-Match': bootstrap.headers['ETag']})
+
+    client = visitor_client(visitor_id, session_id)
+    check(client, 'daily shlokas, first visit of the day', 'GET', '/api/shlokas/daily')
+    daily = check(client, 'daily shlokas, repeat visit', 'GET', '/api/shlokas/daily')
+    check(client, 'daily shlokas, not modified', 'GET', '/api/shlokas/daily',
+          headers={'If-None-Match': daily.headers['ETag']})
+    shloka_id = daily.get_json()['shlokas'][0]['id']
+    check(client, 'toggle favorite', 'POST', '/api/favorites/toggle', json={'shloka_id': shloka_id})
+    check(client, 'favorites', 'GET', '/api/favorites')
+    reviewed = [s['id'] for s in daily.get_json()['shlokas'] if s['isReview']]
+    check(client, 'mark complete', 'POST', '/api/shlokas/mark-complete', json={'reviewed': reviewed})
+    # Review cards read on a completed day must leave the review queue
+    still_due = set(reviewed) & {s['id'] for s in client.get('/api/shlokas/daily').get_json()['shlokas'] if s['isReview']}
+    if not reviewed or still_due:
+        raise RuntimeError(f"mark complete: review cards {sorted(still_due) or reviewed} were not rescheduled")
+    progress = check(client, 'progress', 'GET', '/api/progress')
+    check(client, 'progress, not modified', 'GET', '/api/progress',
+          headers={'If-None-Match': progress.headers['ETag']})
+    check(client, 'notification time', 'GET', '/api/user/notification-time')
+    quiz = check(client, 'generate quiz', 'POST', '/api/quiz/generate').get_json()
+    submission = {
+        'quiz_id': quiz['quiz_id'],
+        'answers': {str(q['id']): q['options'][0]['id'] for q in quiz['questions']}
+    }
+    check(client, 'submit quiz', 'POST', '/api/quiz/submit', json=submission)
+    check(client, 'submit quiz again', 'POST', '/api/quiz/submit', json=submission)
+
+    with app.app_context():
+        event.remove(db.engine, 'before_cursor_execute', counter)
+    return results
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Fail when an endpoint issues more SQL statements than its budget")
+    parser.add_argument('-v', '--verbose', action='store_true', help="Show the statements of over-budget requests")
+    args = parser.parse_args(argv)
+
+    workdir = tempfile.TemporaryDirectory()
+    os.environ['DATABASE_URL'] = 'sqlite:///' + os.path.join(workdir.name, 'budgets.db')
+    os.environ.setdefault('LOG_LEVEL', 'WARNING')
+
+    results = run_checks()
+    failures = 0
+    for name, queries, budget, statements in results:
+        over = queries > budget
+        failures += over
+        print(f"{'FAIL' if over else 'ok':<5} {name:<44} {queries:>3} / {budget}")
+        if over and args.verbose:
+            for statement in statements:
+                print(f"      {statement}")
+
+    from app import app, db
+    from activity import last_seen
+    with app.app_context():
+        last_seen.flush()
+        db.engine.dispose()
+    workdir.cleanup()
+
+    if failures:
+        print(f"{failures} request(s) over their query budget")
+        return 1
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
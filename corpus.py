@@ -0,0 +1,176 @@
+import re
+import hashlib
+from threading import Lock
+from app import db
+from models import Shloka
+from distractors import DistractorEngine
+from search import SearchIndex
+
+# Shloka ids look like "c:2v47" (chapter 2, verse 47)
+VERSE_ID_PATTERN = re.compile(r'^c:(\d+)v(\d+)$')
+
+def parse_verse_id(shloka_id):
+    """Parse a shloka id into (chapter, verse), or None if it is malformed"""
+    match = VERSE_ID_PATTERN.match(shloka_id or '')
+    if not match:
+        return None
+    return int(match.group(1)), int(match.group(2))
+
+def _reading_order_key(shloka_id):
+    parsed = parse_verse_id(shloka_id)
+    # Malformed ids sort after every well-formed verse
+    return (0, parsed, '') if parsed else (1, (0, 0), shloka_id)
+
+def compute_ordinals(shloka_ids):
+    """Map each shloka id to its position in reading order (chapter, then verse)"""
+    ordered = sorted(shloka_ids, key=_reading_order_key)
+    return {shloka_id: ordinal for ordinal, shloka_id in enumerate(ordered)}
+
+class Verse:
+    """A single read-only shloka held in memory"""
+    __slots__ = ('id', 'chapter', 'verse', 'ordinal', 'sanskrit', 'english')
+
+    def __init__(self, id, chapter, verse, ordinal, sanskrit, english):
+        object.__setattr__(self, 'id', id)
+        object.__setattr__(self, 'chapter', chapter)
+        object.__setattr__(self, 'verse', verse)
+        object.__setattr__(self, 'ordinal', ordinal)
+        object.__setattr__(self, 'sanskrit', sanskrit)
+        object.__setattr__(self, 'english', english)
+
+    def __setattr__(self, name, value):
+        raise AttributeError('Verse objects are read-only')
+
+    def __reduce__(self):
+        return (Verse, (self.id, self.chapter, self.verse, self.ordinal, self.sanskrit, self.english))
+
+    def __repr__(self):
+        return f"<Verse {self.id}>"
+
+class ShlokaCorpus:
+    """Immutable, ordered collection of all shlokas.
+
+    Verses are stored in reading order (chapter, then verse), so a verse's
+    ordinal is simply its position in that sequence.
+    """
+
+    def __init__(self, rows):
+        """Build the corpus from (id, sanskrit, english, ordinal) tuples in any order.
+
+        Persisted ordinals are used when every row has one; otherwise the
+        order is derived from the ids.
+        """
+        rows = list(rows)
+        if rows and all(row[3] is not None for row in rows):
+            rows.sort(key=lambda row: row[3])
+        else:
+            rows.sort(key=lambda row: _reading_order_key(row[0]))
+
+        verses = []
+        chapters = {}
+        for ordinal, (shloka_id, sanskrit, english, _) in enumerate(rows):
+            parsed = parse_verse_id(shloka_id)
+            chapter, verse = parsed if parsed else (None, None)
+            verses.append(Verse(shloka_id, chapter, verse, ordinal, sanskrit, english))
+            if chapter is not None:
+                start, _ = chapters.get(chapter, (ordinal, ordinal))
+                chapters[chapter] = (start, ordinal + 1)
+
+        self._verses = tuple(verses)
+        self._by_id = {v.id: v for v in verses}
+        self.version = self._content_hash()
+        self._chapters = chapters
+        self.distractors = DistractorEngine(self._verses)
+        self.search_index = SearchIndex(self._verses)
+
+    def _content_hash(self):
+        """Short hash of the verse text, used to version cached responses"""
+        digest = hashlib.sha1()
+        for v in self._verses:
+            digest.update(f"{v.id}\x00{v.sanskrit}\x00{v.english}\x00".encode('utf-8'))
+        return digest.hexdigest()[:12]
+
+    def __len__(self):
+        return len(self._verses)
+
+    def __iter__(self):
+        return iter(self._verses)
+
+    def __contains__(self, shloka_id):
+        return shloka_id in self._by_id
+
+    def __getitem__(self, shloka_id):
+        return self._by_id[shloka_id]
+
+    def get(self, shloka_id, default=None):
+        """Look up a verse by its id"""
+        return self._by_id.get(shloka_id, default)
+
+    def get_many(self, shloka_ids):
+        """Look up several verses, skipping unknown ids, in reading order"""
+        found = {self._by_id[i] for i in shloka_ids if i in self._by_id}
+        return sorted(found, key=lambda v: v.ordinal)
+
+    def at(self, ordinal):
+        """Get the verse at a position in reading order"""
+        return self._verses[ordinal]
+
+    def first(self, count):
+        """Get the first `count` verses in reading order"""
+        return list(self._verses[:count])
+
+    def next_after(self, ordinal, count):
+        """Get the `count` verses following an ordinal, wrapping past the last chapter.
+
+        Pass an ordinal of -1 to start from the beginning.
+        """
+        total = len(self._verses)
+        if not total:
+            return []
+        count = min(count, total)
+        start = (ordinal + 1) % total
+        end = start + count
+        if end <= total:
+            return list(self._verses[start:end])
+        return list(self._verses[start:]) + list(self._verses[:end - total])
+
+    @property
+    def chapters(self):
+        """Sorted chapter numbers present in the corpus"""
+        return sorted(self._chapters)
+
+    def chapter_bounds(self, chapter):
+        """Get the (start, end) ordinal range of a chapter, end exclusive"""
+        return self._chapters[chapter]
+
+    def chapter(self, chapter):
+        """Get all verses of a chapter in order"""
+        start, end = self._chapters[chapter]
+        return self._verses[start:end]
+
+_corpus = None
+_corpus_lock = Lock()
+
+def get_corpus():
+    """Get the process-wide corpus, loading it from the database on first use"""
+    global _corpus
+    if _corpus is not None:
+        return _corpus
+
+    with _corpus_lock:
+        if _corpus is None:
+            rows = db.session.execute(
+                db.select(Shloka.id, Shloka.sanskrit, Shloka.english, Shloka.ordinal)
+            ).all()
+            corpus = ShlokaCorpus(rows)
+            # Don't pin an empty corpus; the shlokas may simply not be loaded yet
+            if not len(corpus):
+                return corpus
+            _corpus = corpus
+    return _corpus
+
+def reset_corpus():
+    """Drop the cached corpus so the next access reloads it"""
+    global _corpus
+    with _corpus_lock:
+        _corpus = None
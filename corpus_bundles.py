@@ -0,0 +1,169 @@
+import os
+import gzip
+import json
+import hashlib
+import logging
+import argparse
+from threading import Lock
+from flask import request, send_from_directory, url_for
+from app import app
+from corpus import ShlokaCorpus, get_corpus
+from http_cache import STATIC_MAX_AGE
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+logger = logging.getLogger(__name__)
+
+# Built bundles live under static/ so a front proxy can also serve them directly
+BUNDLE_DIR = os.path.join(app.static_folder, 'corpus')
+BUNDLE_PREFIX = 'chapter-'
+# Names of the current and previous corpus version's bundles
+MANIFEST_FILE = 'manifest.json'
+# Verses whose id doesn't name a chapter go in one extra bundle
+OTHER_BUNDLE = 'other'
+
+_manifest = None
+_manifest_lock = Lock()
+
+def bundle_key(verse):
+    """The bundle a verse belongs to: its chapter number, or 'other'"""
+    return str(verse.chapter) if verse.chapter is not None else OTHER_BUNDLE
+
+def render_bundles(corpus):
+    """Encode the corpus as one JSON document per chapter; returns {bundle key: bytes}"""
+    chapters = {}
+    for verse in corpus:
+        chapters.setdefault(bundle_key(verse), {})[verse.id] = {
+            'sanskrit': verse.sanskrit,
+            'english': verse.english
+        }
+    return {
+        key: json.dumps(verses, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+        for key, verses in chapters.items()
+    }
+
+def bundle_name(key, data):
+    return f"{BUNDLE_PREFIX}{key}.{hashlib.sha1(data).hexdigest()[:12]}.json"
+
+def _write(path, data):
+    # Write beside the target and rename, so a reader never sees a partial file
+    temporary = f"{path}.{os.getpid()}.tmp"
+    with open(temporary, 'wb') as f:
+        f.write(data)
+    os.replace(temporary, path)
+
+def _read_manifest(out_dir):
+    try:
+        with open(os.path.join(out_dir, MANIFEST_FILE), encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+def build_bundles(corpus, out_dir=BUNDLE_DIR):
+    """Write content-hashed chapter bundles with .gz (and .br, if brotli is installed) copies.
+
+    Bundles that already exist are left alone, and nothing is removed; see
+    prune_bundles. An empty corpus writes nothing. Returns {bundle key: file name}.
+    """
+    if not len(corpus):
+        return {}
+    os.makedirs(out_dir, exist_ok=True)
+    manifest = {}
+    for key, data in render_bundles(corpus).items():
+        name = bundle_name(key, data)
+        manifest[key] = name
+        path = os.path.join(out_dir, name)
+        if os.path.exists(path) and (brotli is None or os.path.exists(path + '.br')):
+            continue
+        _write(path + '.gz', gzip.compress(data, compresslevel=9, mtime=0))
+        if brotli is not None:
+            _write(path + '.br', brotli.compress(data, quality=11))
+        # Uncompressed last: its presence marks the bundle as complete
+        _write(path, data)
+
+    recorded = _read_manifest(out_dir)
+    if recorded.get('current') != manifest:
+        _write(os.path.join(out_dir, MANIFEST_FILE), json.dumps({
+            'current': manifest,
+            'previous': recorded.get('current') or recorded.get('previous') or {}
+        }, indent=2).encode('utf-8'))
+    return manifest
+
+def prune_bundles(out_dir=BUNDLE_DIR):
+    """Delete bundles of all but the current and previous corpus versions; returns the files removed.
+
+    The previous version is kept so pages rendered before a corpus change
+    can still load their bundles. Only the build command prunes, never a
+    running server.
+    """
+    recorded = _read_manifest(out_dir)
+    if not recorded.get('current'):
+        return 0
+    keep = set(recorded['current'].values()) | set(recorded.get('previous', {}).values())
+    removed = 0
+    for name in os.listdir(out_dir):
+        if name.startswith(BUNDLE_PREFIX) and name.split('.json')[0] + '.json' not in keep:
+            try:
+                os.remove(os.path.join(out_dir, name))
+                removed += 1
+            except OSError:
+                pass
+    return removed
+
+def bundle_manifest():
+    """{bundle key: file name} for the current corpus.
+
+    Only computes the names; the files are written by build_bundles, at
+    startup or by the build command, never while serving requests.
+    """
+    global _manifest
+    corpus = get_corpus()
+    manifest = _manifest
+    if manifest is not None and manifest[0] == corpus.version:
+        return manifest[1]
+
+    with _manifest_lock:
+        if _manifest is None or _manifest[0] != corpus.version:
+            _manifest = (corpus.version, {key: bundle_name(key, data) for key, data in render_bundles(corpus).items()})
+        return _manifest[1]
+
+@app.context_processor
+def inject_corpus_bundles():
+    """Bundle URLs by chapter, for pages whose scripts look up verse text"""
+    return {'corpus_bundles': {
+        key: url_for('corpus_bundle', filename=name) for key, name in bundle_manifest().items()
+    }}
+
+def send_bundle(filename):
+    """Serve a bundle in the best precompressed encoding the client accepts"""
+    encodings = request.accept_encodings
+    encoding = None
+    if brotli is not None and encodings.quality('br') > 0:
+        encoding = 'br'
+    elif encodings.quality('gzip') > 0:
+        encoding = 'gzip'
+    suffix = {'br': '.br', 'gzip': '.gz'}.get(encoding, '')
+
+    response = send_from_directory(BUNDLE_DIR, filename + suffix, mimetype='application/json')
+    if encoding:
+        response.headers['Content-Encoding'] = encoding
+    response.vary.add('Accept-Encoding')
+    # Bundle names carry a content hash, so they never change under the same URL
+    response.headers['Cache-Control'] = f'public, max-age={STATIC_MAX_AGE}, immutable'
+    return response
+
+if __name__ == "__main__":
+    # A build step: straight from the CSV, without needing a database
+    from utils import CORPUS_CSV_PATH, read_shlokas_csv
+    parser = argparse.ArgumentParser(description="Write the precompressed, content-hashed corpus bundles")
+    parser.add_argument('--csv', default=CORPUS_CSV_PATH, help=f"Shloka CSV to read (default {CORPUS_CSV_PATH})")
+    parser.add_argument('--out', default=BUNDLE_DIR, help="Directory to write the bundles to (default static/corpus)")
+    args = parser.parse_args()
+    corpus = ShlokaCorpus((shloka_id, sanskrit, english, None) for shloka_id, sanskrit, english in read_shlokas_csv(args.csv))
+    bundles = build_bundles(corpus, args.out)
+    removed = prune_bundles(args.out)
+    print(f"{len(bundles)} bundles written to {args.out}, {removed} old files removed"
+          + ('' if brotli else ' (gzip only; install brotli for .br)'))
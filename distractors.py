@@ -0,0 +1,54 @@
+import random
+
+# Number of candidate distractors kept per verse
+POOL_SIZE = 12
+
+class DistractorEngine:
+    """Precomputed wrong-answer pools for quiz questions.
+
+    Each verse gets a pool of the verses from its own chapter whose English
+    translation is closest in length, so options can't be told apart by
+    chapter or length alone. Pools are built once per corpus and sampled in
+    memory.
+    """
+
+    def __init__(self, verses, pool_size=POOL_SIZE):
+        self._verses = tuple(verses)
+        by_chapter = {}
+        for verse in self._verses:
+            by_chapter.setdefault(verse.chapter, []).append(verse)
+
+        pools = {}
+        for verse in self._verses:
+            length = len(verse.english)
+            candidates = [v for v in by_chapter[verse.chapter] if v.id != verse.id]
+            # Top up from neighbouring verses across chapters if a chapter is too short
+            if len(candidates) < pool_size:
+                neighbours = sorted(
+                    (v for v in self._verses if v.chapter != verse.chapter),
+                    key=lambda v: abs(v.ordinal - verse.ordinal)
+                )
+                candidates.extend(neighbours[:pool_size - len(candidates)])
+            candidates.sort(key=lambda v: (abs(len(v.english) - length), v.ordinal))
+            pools[verse.id] = tuple(v.ordinal for v in candidates[:pool_size])
+        self._pools = pools
+
+    def pool(self, verse):
+        """Get the candidate distractors for a verse, nearest in length first"""
+        return [self._verses[ordinal] for ordinal in self._pools.get(verse.id, ())]
+
+    def sample(self, verse, count, rng=None, exclude=()):
+        """Pick `count` distinct distractors for a verse.
+
+        Never returns the verse itself or anything in `exclude`. Falls back to
+        the whole corpus if the pool runs out.
+        """
+        rng = rng or random
+        excluded = set(exclude) | {verse.id}
+        candidates = [v for v in self.pool(verse) if v.id not in excluded]
+        if len(candidates) >= count:
+            return rng.sample(candidates, count)
+
+        chosen = {v.id for v in candidates} | excluded
+        others = [v for v in self._verses if v.id not in chosen]
+        return candidates + rng.sample(others, min(count - len(candidates), len(others)))
@@ -0,0 +1,18 @@
+import gc
+import os
+
+# Import the app (and run startup.prepare) once in the master, then fork workers.
+# The reloader doesn't work with preloading, so development runs with --reload
+# set GUNICORN_PRELOAD=0.
+preload_app = os.environ.get('GUNICORN_PRELOAD', '1') == '1'
+
+def when_ready(server):
+    # Keep the preloaded corpus out of the garbage collector's reach so
+    # collections in workers don't touch (and copy) the shared pages
+    gc.freeze()
+
+def post_fork(server, worker):
+    from app import app, db
+    # Connections must never be shared across processes
+    with app.app_context():
+        db.engine.dispose(close=False)
@@ -0,0 +1,213 @@
+import time
+import logging
+import argparse
+from datetime import date, timedelta
+import sqlalchemy as sa
+from app import app, db
+from models import Visitor, ProgressYear, DailyProgress, VisitorShloka, dialect_insert
+from corpus import get_corpus
+
+logger = logging.getLogger(__name__)
+
+BITS_PER_COLUMN = 63
+BIT_COLUMNS = tuple(f'bits_{i}' for i in range(6))
+
+# Daily rows newer than this are kept; the weekly quiz needs at least the current week
+DEFAULT_KEEP_DAYS = 35
+MIN_KEEP_DAYS = 7
+COMPACT_BATCH_SIZE = 1000
+# Seconds between compactions when running as a background process
+COMPACT_INTERVAL = 24 * 3600
+
+def _position(day):
+    """(column, bit) of a day within its year's bitmap"""
+    return divmod(day.timetuple().tm_yday - 1, BITS_PER_COLUMN)
+
+def bitmap_rows(visitor_id, days):
+    """progress_years rows with the bits of the given days set, one per year"""
+    rows = {}
+    for day in days:
+        row = rows.setdefault(day.year, dict(
+            {'visitor_id': visitor_id, 'year': day.year}, **{c: 0 for c in BIT_COLUMNS}
+        ))
+        column, bit = _position(day)
+        row[BIT_COLUMNS[column]] |= 1 << bit
+    return list(rows.values())
+
+def _merge_insert():
+    """Upsert that ORs bitmap rows into the stored ones"""
+    insert = dialect_insert(ProgressYear)
+    return insert.on_conflict_do_update(
+        index_elements=['visitor_id', 'year'],
+        set_={c: ProgressYear.__table__.c[c].op('|')(insert.excluded[c]) for c in BIT_COLUMNS}
+    )
+
+def merge_completions(execute, rows):
+    """OR bitmap rows into the stored ones in one statement; execute is session.execute or connection.execute"""
+    if not rows:
+        return
+    execute(_merge_insert(), rows)
+
+def completed_days(progress_year):
+    """Set of completed dates stored in a progress_years row"""
+    start = date(progress_year.year, 1, 1)
+    days = set()
+    for column, name in enumerate(BIT_COLUMNS):
+        bits = getattr(progress_year, name) or 0
+        while bits:
+            bit = (bits & -bits).bit_length() - 1
+            days.add(start + timedelta(days=column * BITS_PER_COLUMN + bit))
+            bits &= bits - 1
+    return days
+
+def record_completion(visitor_id, day, returning=(), **values):
+    """Set a day's bit and advance the visitor's streak counters, without reading anything first.
+    
+    values are further visitor columns to set in the same UPDATE. Returns
+    the day's progress_years row and the visitor's streak columns, plus any
+    `returning` expressions, as the two statements leave them.
+    """
+    year = db.session.execute(
+        _merge_insert()
+        .values(bitmap_rows(visitor_id, [day])[0])
+        .returning(ProgressYear.year, *(ProgressYear.__table__.c[c] for c in BIT_COLUMNS))
+    ).one()
+
+    last = Visitor.last_completed_date
+    current = sa.case(
+        (last >= day, Visitor.current_streak),
+        (last == day - timedelta(days=1), Visitor.current_streak + 1),
+        else_=1
+    )
+    visitor = db.session.execute(
+        db.update(Visitor)
+        .where(Visitor.id == visitor_id)
+        .values(
+            current_streak=current,
+            longest_streak=sa.case((current > Visitor.longest_streak, current), else_=Visitor.longest_streak),
+            last_completed_date=sa.case((last >= day, last), else_=day),
+            **values
+        )
+        .returning(Visitor.current_streak, Visitor.longest_streak, Visitor.last_completed_date, *returning)
+        .execution_options(synchronize_session=False)
+    ).one()
+    return year, visitor
+
+def streaks(visitor, today=None):
+    """The visitor's (current, longest) streak; the current one lapses after a missed day.
+    
+    visitor is a Visitor or any row with its streak columns.
+    """
+    today = today or date.today()
+    last = visitor.last_completed_date
+    current = visitor.current_streak if last is not None and last >= today - timedelta(days=1) else 0
+    return current, visitor.longest_streak
+
+def compute_streaks(days):
+    """(current streak, longest streak, last day) over a set of completed dates, current as of the last day"""
+    current = longest = 0
+    previous = None
+    for day in sorted(days):
+        current = current + 1 if previous is not None and day - previous == timedelta(days=1) else 1
+        longest = max(longest, current)
+        previous = day
+    return current, longest, previous
+
+def compact(keep_days=DEFAULT_KEEP_DAYS, batch_size=COMPACT_BATCH_SIZE):
+    """Fold daily rows older than keep_days into the bitmaps and delete them.
+
+    Completed daily_progress rows are merged into progress_years first.
+    Visitors without a stored reading cursor get one derived from their
+    assignments before those assignments are deleted. Every step is
+    idempotent, so an interrupted run can simply be repeated. Must run in an
+    app context. Returns (progress rows, assignment rows) deleted.
+    """
+    from utils import last_assigned_ordinals  # utils imports this module
+
+    keep_days = max(keep_days, MIN_KEEP_DAYS)
+    cutoff = date.today() - timedelta(days=keep_days)
+    corpus = get_corpus()
+
+    progress_deleted = 0
+    while True:
+        rows = db.session.execute(
+            db.select(DailyProgress.id, DailyProgress.visitor_id, DailyProgress.date, DailyProgress.completed)
+            .where(DailyProgress.date < cutoff)
+            .order_by(DailyProgress.id)
+            .limit(batch_size)
+        ).all()
+        if not rows:
+            break
+        by_visitor = {}
+        for row in rows:
+            if row.completed:
+                by_visitor.setdefault(row.visitor_id, []).append(row.date)
+        merge_completions(db.session.execute, [
+            bitmap_row for visitor_id, days in by_visitor.items() for bitmap_row in bitmap_rows(visitor_id, days)
+        ])
+        db.session.execute(
+            db.delete(DailyProgress).where(DailyProgress.id.in_([row.id for row in rows]))
+            .execution_options(synchronize_session=False)
+        )
+        db.session.commit()
+        progress_deleted += len(rows)
+
+    # Store cursors for visitors who only have them implicitly in their history
+    last_id = ''
+    while True:
+        legacy = db.session.execute(
+            db.select(Visitor.id, Visitor.last_shloka_date)
+            .where(Visitor.shloka_cursor.is_(None), Visitor.last_shloka_date.isnot(None), Visitor.id > last_id)
+            .order_by(Visitor.id)
+            .limit(batch_size)
+        ).all()
+        if not legacy:
+            break
+        last_id = legacy[-1].id
+        cursors = last_assigned_ordinals([(v.id, v.last_shloka_date) for v in legacy], corpus)
+        updates = [{'id': visitor_id, 'shloka_cursor': ordinal}
+                   for visitor_id, ordinal in cursors.items() if ordinal is not None]
+        if updates:
+            db.session.execute(db.update(Visitor), updates)
+        db.session.commit()
+
+    assignments_deleted = 0
+    while True:
+        ids = db.session.scalars(
+            db.select(VisitorShloka.id).where(VisitorShloka.date < cutoff).order_by(VisitorShloka.id).limit(batch_size)
+        ).all()
+        if not ids:
+            break
+        db.session.execute(
+            db.delete(VisitorShloka).where(VisitorShloka.id.in_(ids)).execution_options(synchronize_session=False)
+        )
+        db.session.commit()
+        assignments_deleted += len(ids)
+
+    logger.info(f"Compacted history before {cutoff}: {progress_deleted} progress rows, "
+                f"{assignments_deleted} assignment rows removed")
+    return progress_deleted, assignments_deleted
+
+def run_compactor(keep_days=DEFAULT_KEEP_DAYS, interval=COMPACT_INTERVAL):
+    """Compact now and then once every interval, forever; a failed run is logged and retried next time"""
+    while True:
+        with app.app_context():
+            try:
+                compact(keep_days)
+            except Exception:
+                logger.exception("History compaction failed")
+                db.session.rollback()
+        time.sleep(interval)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compact old daily progress and assignment rows")
+    parser.add_argument('command', choices=['compact', 'run'],
+                        help="compact once, or run in the background compacting daily")
+    parser.add_argument('--keep-days', type=int, default=DEFAULT_KEEP_DAYS,
+                        help=f"Keep daily rows from this many recent days (default {DEFAULT_KEEP_DAYS}, minimum {MIN_KEEP_DAYS})")
+    args = parser.parse_args()
+    if args.command == 'run':
+        run_compactor(args.keep_days)
+    else:
+        with app.app_context():
+            compact(args.keep_days)
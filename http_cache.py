@@ -0,0 +1,70 @@
+import hashlib
+import os
+from functools import wraps
+from flask import request, make_response
+from app import app
+
+# Fingerprinted static assets never change under the same URL
+STATIC_MAX_AGE = 365 * 24 * 3600
+
+def make_etag(*parts):
+    """Build a strong ETag value from the parts that determine a response"""
+    return hashlib.sha1(':'.join(str(p) for p in parts).encode('utf-8')).hexdigest()
+
+def conditional(etag_func, cache_control='private, no-cache'):
+    """Serve 304 Not Modified when the client already has the current version.
+    
+    etag_func is called before the view; if the request's If-None-Match
+    matches, the view is skipped entirely. It is called again afterwards to
+    tag the fresh response, since the view may have created state (such as a
+    new visitor) that the tag depends on.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapped(*args, **kwargs):
+            etag = etag_func()
+            if etag is not None and etag in request.if_none_match:
+                response = make_response('', 304)
+            else:
+                response = make_response(view(*args, **kwargs))
+                if response.status_code != 200:
+                    return response
+                etag = etag_func()
+            if etag is not None:
+                response.set_etag(etag)
+                response.headers['Cache-Control'] = cache_control
+                response.vary.add('Cookie')
+            return response
+        return wrapped
+    return decorator
+
+_static_fingerprints = {}
+
+def static_fingerprint(filename):
+    """Short content hash of a static file, recomputed when the file changes"""
+    path = os.path.join(app.static_folder, filename)
+    try:
+        mtime = os.path.getmtime(path)
+    except OSError:
+        return None
+    cached = _static_fingerprints.get(filename)
+    if cached and cached[0] == mtime:
+        return cached[1]
+    with open(path, 'rb') as f:
+        fingerprint = hashlib.sha1(f.read()).hexdigest()[:12]
+    _static_fingerprints[filename] = (mtime, fingerprint)
+    return fingerprint
+
+@app.url_defaults
+def fingerprint_static_urls(endpoint, values):
+    """Append ?v=<content hash> to static URLs so they can be cached forever"""
+    if endpoint == 'static' and 'filename' in values and 'v' not in values:
+        fingerprint = static_fingerprint(values['filename'])
+        if fingerprint:
+            values['v'] = fingerprint
+
+@app.after_request
+def cache_static_assets(response):
+    if request.endpoint == 'static' and 'v' in request.args and response.status_code in (200, 304):
+        response.headers['Cache-Control'] = f'public, max-age={STATIC_MAX_AGE}, immutable'
+    return response
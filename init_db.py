@@ -1,6 +1,5 @@
-from app import app, db
-import models  # ensure models are imported for table creation
+from migrations import upgrade
 
-with app.app_context():
-    db.create_all()
-    print("Database initialized.")
+# Create the schema, or bring an existing database up to date without data loss
+applied = upgrade()
+print(f"Database initialized ({applied} migrations applied).")
@@ -1,6 +1,17 @@
+import sys
+import argparse
 from app import app
-from utils import load_shlokas_from_csv
+from utils import CORPUS_CSV_PATH, load_shlokas_from_csv
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Load or re-sync shlokas from the corpus CSV")
+    parser.add_argument('--csv', default=CORPUS_CSV_PATH, help="Path to the shloka CSV")
+    parser.add_argument('--force', action='store_true', help="Re-sync even if the CSV checksum is unchanged")
+    args = parser.parse_args()
+    
     with app.app_context():
-        load_shlokas_from_csv()
\ No newline at end of file
+        try:
+            changed = load_shlokas_from_csv(args.csv, force=args.force)
+        except Exception as e:
+            sys.exit(f"Could not load shlokas: {str(e)}")
+    print(f"{changed} shlokas inserted or updated.")
@@ -0,0 +1,108 @@
+import os
+import sys
+import json
+import atexit
+import queue
+import random
+import logging
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener
+
+# Attributes every LogRecord has; anything else was passed via `extra` and is a structured field
+_RECORD_ATTRIBUTES = set(vars(logging.makeLogRecord({}))) | {'message', 'asctime'}
+
+def _fields(record):
+    return {k: v for k, v in vars(record).items() if k not in _RECORD_ATTRIBUTES}
+
+class JSONFormatter(logging.Formatter):
+    """One JSON object per line, including any fields passed via `extra`"""
+
+    def format(self, record):
+        entry = {
+            'time': datetime.fromtimestamp(record.created, timezone.utc).isoformat(),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+        }
+        entry.update(_fields(record))
+        if record.exc_info:
+            entry['exception'] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+class TextFormatter(logging.Formatter):
+    """Human-readable lines with structured fields appended as key=value"""
+
+    def __init__(self):
+        super().__init__('%(asctime)s %(levelname)s %(name)s: %(message)s')
+
+    def format(self, record):
+        line = super().format(record)
+        fields = _fields(record)
+        if fields:
+            line += ' ' + ' '.join(f"{k}={v}" for k, v in fields.items())
+        return line
+
+class DebugSampler(logging.Filter):
+    """Keep only a random fraction of DEBUG records; other levels always pass"""
+
+    def __init__(self, rate):
+        super().__init__()
+        self.rate = rate
+
+    def filter(self, record):
+        return record.levelno > logging.DEBUG or random.random() < self.rate
+
+class AsyncLogging:
+    """Hand records to a background thread so request threads never block on log I/O.
+
+    The listener thread doesn't survive fork, so each child process (such as
+    a gunicorn worker forked from a preloaded master) starts its own.
+    """
+
+    def __init__(self, handlers):
+        self.handlers = handlers
+        self.handler = QueueHandler(queue.SimpleQueue())
+        self.listener = None
+
+    def start(self):
+        self.handler.queue = queue.SimpleQueue()
+        self.listener = QueueListener(self.handler.queue, *self.handlers, respect_handler_level=True)
+        self.listener.start()
+
+    def stop(self):
+        if self.listener is not None:
+            self.listener.stop()
+            self.listener = None
+
+_async_logging = None
+
+def configure_logging():
+    """Set up root logging from the environment.
+
+    LOG_LEVEL             minimum level (default INFO)
+    LOG_FORMAT            'text' (default) or 'json'
+    LOG_DEBUG_SAMPLE_RATE fraction of DEBUG records kept (default 0.01)
+    LOG_SQL               set to 1 to log SQLAlchemy statements
+    """
+    global _async_logging
+    if _async_logging is not None:
+        return
+
+    level = os.environ.get('LOG_LEVEL', 'INFO').upper()
+    formatter = JSONFormatter() if os.environ.get('LOG_FORMAT', 'text').lower() == 'json' else TextFormatter()
+    output = logging.StreamHandler(sys.stderr)
+    output.setFormatter(formatter)
+
+    _async_logging = AsyncLogging([output])
+    _async_logging.handler.addFilter(DebugSampler(float(os.environ.get('LOG_DEBUG_SAMPLE_RATE', '0.01'))))
+    _async_logging.start()
+
+    root = logging.getLogger()
+    root.handlers[:] = [_async_logging.handler]
+    root.setLevel(level)
+
+    if os.environ.get('LOG_SQL') != '1':
+        logging.getLogger('sqlalchemy').setLevel(logging.WARNING)
+
+    os.register_at_fork(after_in_child=_async_logging.start)
+    atexit.register(_async_logging.stop)
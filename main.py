@@ -1,5 +1,10 @@
 from app import app
 import routes  # noqa: F401
+from startup import prepare
+
+# Runs once in the gunicorn master with preload_app (see gunicorn.conf.py)
+prepare()
+
 #let render handle it
 if __name__ == "__main__":
     app.run(host="0.0.0.0", port=5000, debug=True)
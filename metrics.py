@@ -0,0 +1,166 @@
+import os
+import hmac
+from bisect import bisect_left
+from threading import Lock
+from time import perf_counter
+from flask import g, request, has_request_context
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from app import app
+import cache
+
+# Histogram bucket upper bounds
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 3, 5, 8, 13, 21, 34, 55)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576)
+
+# Add a Server-Timing header (query count, DB time, total time) to every response
+app.config.setdefault('SERVER_TIMING', os.environ.get('SERVER_TIMING') == '1')
+# Bearer token scrapers must send to read /metrics; without one the endpoint is off
+app.config.setdefault('METRICS_TOKEN', os.environ.get('METRICS_TOKEN', ''))
+
+def metrics_enabled():
+    return bool(app.config['METRICS_TOKEN'])
+
+def metrics_authorized():
+    """Whether the request carries the configured metrics token"""
+    scheme, _, supplied = request.headers.get('Authorization', '').partition(' ')
+    return (metrics_enabled() and scheme.lower() == 'bearer'
+            and hmac.compare_digest(supplied.encode('utf-8'), app.config['METRICS_TOKEN'].encode('utf-8')))
+
+class Histogram:
+    """Cumulative-bucket histogram per label set, in the Prometheus sense"""
+
+    def __init__(self, name, help, buckets):
+        self.name = name
+        self.help = help
+        self.buckets = buckets
+        self._series = {}
+        self._lock = Lock()
+
+    def observe(self, labels, value):
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][bisect_left(self.buckets, value)] += 1
+            series[1] += value
+            series[2] += 1
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            series = sorted(self._series.items())
+            series = [(labels, list(counts), total, count) for labels, (counts, total, count) in series]
+        for labels, counts, total, count in series:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, counts):
+                cumulative += bucket_count
+                lines.append(f"{self.name}_bucket{_labels(labels, le=_number(bound))} {cumulative}")
+            lines.append(f"{self.name}_bucket{_labels(labels, le='+Inf')} {count}")
+            lines.append(f"{self.name}_sum{_labels(labels)} {_number(total)}")
+            lines.append(f"{self.name}_count{_labels(labels)} {count}")
+        return lines
+
+class Counter:
+    """Monotonic counter per label set"""
+
+    def __init__(self, name, help):
+        self.name = name
+        self.help = help
+        self._values = {}
+        self._lock = Lock()
+
+    def inc(self, labels, amount=1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            values = sorted(self._values.items())
+        lines.extend(f"{self.name}{_labels(labels)} {_number(value)}" for labels, value in values)
+        return lines
+
+def _number(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+def _labels(labels, **extra):
+    pairs = list(labels) + list(extra.items())
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{k}="{_escape(v)}"' for k, v in pairs) + '}'
+
+requests_total = Counter('gita_http_requests_total', 'Requests handled, by endpoint, method and status')
+request_latency = Histogram('gita_http_request_duration_seconds', 'Time spent handling a request', LATENCY_BUCKETS)
+request_queries = Histogram('gita_http_request_queries', 'SQL statements executed per request', QUERY_COUNT_BUCKETS)
+request_db_time = Histogram('gita_http_request_db_seconds', 'Time spent in SQL statements per request', LATENCY_BUCKETS)
+response_size = Histogram('gita_http_response_size_bytes', 'Response body size', SIZE_BUCKETS)
+background_queries = Counter('gita_db_background_queries_total', 'SQL statements executed outside of requests')
+
+@event.listens_for(Engine, 'before_cursor_execute')
+def _start_query_timer(conn, cursor, statement, parameters, context, executemany):
+    # Kept on the statement's own execution context, so a statement that
+    # raises (and never reaches after_cursor_execute) leaves nothing behind
+    if context is not None:
+        context.metrics_query_start = perf_counter()
+
+@event.listens_for(Engine, 'after_cursor_execute')
+def _record_query(conn, cursor, statement, parameters, context, executemany):
+    start = getattr(context, 'metrics_query_start', None)
+    elapsed = perf_counter() - start if start is not None else 0.0
+    if has_request_context() and 'metrics_start' in g:
+        g.metrics_queries += 1
+        g.metrics_db_time += elapsed
+    else:
+        background_queries.inc(())
+
+@app.before_request
+def start_request_metrics():
+    g.metrics_start = perf_counter()
+    g.metrics_queries = 0
+    g.metrics_db_time = 0.0
+
+@app.after_request
+def record_request_metrics(response):
+    if 'metrics_start' not in g:
+        return response
+    elapsed = perf_counter() - g.metrics_start
+    endpoint = (('endpoint', request.endpoint or 'unmatched'),)
+
+    requests_total.inc(endpoint + (('method', request.method), ('status', response.status_code)))
+    request_latency.observe(endpoint, elapsed)
+    request_queries.observe(endpoint, g.metrics_queries)
+    request_db_time.observe(endpoint, g.metrics_db_time)
+    size = response.calculate_content_length()
+    if size is not None:
+        response_size.observe(endpoint, size)
+
+    if app.config['SERVER_TIMING']:
+        response.headers.add(
+            'Server-Timing',
+            f'db;dur={g.metrics_db_time * 1000:.1f};desc="{g.metrics_queries} queries", '
+            f'app;dur={elapsed * 1000:.1f}'
+        )
+    return response
+
+def _cache_lines():
+    lines = [
+        "# HELP gita_cache_lookups_total Result cache lookups, by cached function and outcome",
+        "# TYPE gita_cache_lookups_total counter",
+    ]
+    for name, counters in sorted(cache.stats.items()):
+        for outcome in ('hits', 'misses'):
+            lines.append(f"gita_cache_lookups_total{_labels((('function', name), ('outcome', outcome)))} {counters[outcome]}")
+    return lines
+
+def render_metrics():
+    """All metrics of this worker process in Prometheus text format"""
+    lines = []
+    for metric in (requests_total, request_latency, request_queries, request_db_time, response_size, background_queries):
+        lines.extend(metric.render())
+    lines.extend(_cache_lines())
+    return '\n'.join(lines) + '\n'
@@ -0,0 +1,292 @@
+import sys
+import json
+import logging
+from datetime import date, datetime
+import sqlalchemy as sa
+from app import app, db
+import models  # ensure models are registered on db.metadata
+import review
+import history
+
+logger = logging.getLogger(__name__)
+
+# Applied versions are recorded here, separately from the application models
+migration_metadata = sa.MetaData()
+schema_migrations = sa.Table(
+    'schema_migrations', migration_metadata,
+    sa.Column('version', sa.Integer, primary_key=True),
+    sa.Column('description', sa.String, nullable=False),
+    sa.Column('applied_at', sa.DateTime, nullable=False),
+)
+
+# Registered migrations as (version, description, function), applied in version order.
+# Every migration must be safe to run against a database that already has its
+# changes, because a fresh database gets the full current schema from step 1.
+MIGRATIONS = []
+
+def migration(version, description):
+    """Register a function taking a connection as a schema migration"""
+    def decorator(fn):
+        MIGRATIONS.append((version, description, fn))
+        return fn
+    return decorator
+
+def _has_column(conn, table, column):
+    return column in {c['name'] for c in sa.inspect(conn).get_columns(table)}
+
+def _add_column(conn, table, column, ddl_type):
+    if not _has_column(conn, table, column):
+        conn.execute(sa.text(f"ALTER TABLE {table} ADD COLUMN {column} {ddl_type}"))
+
+def _has_unique(conn, table, columns):
+    """Check for a unique constraint or unique index covering exactly these columns"""
+    inspector = sa.inspect(conn)
+    columns = list(columns)
+    for constraint in inspector.get_unique_constraints(table):
+        if constraint['column_names'] == columns:
+            return True
+    for index in inspector.get_indexes(table):
+        if index['unique'] and index['column_names'] == columns:
+            return True
+    return False
+
+def _create_model_index(conn, model, name):
+    """Create one of a model's declared indexes if it doesn't exist yet"""
+    index = next(i for i in model.__table__.indexes if i.name == name)
+    index.create(bind=conn, checkfirst=True)
+
+def _create_unique_index(conn, table, name, columns):
+    if not _has_unique(conn, table, columns):
+        conn.execute(sa.text(f"CREATE UNIQUE INDEX {name} ON {table} ({', '.join(columns)})"))
+
+@migration(1, 'Create any missing tables')
+def create_tables(conn):
+    db.metadata.create_all(conn)
+
+@migration(2, 'Add shloka reading-order ordinal')
+def add_shloka_ordinal(conn):
+    _add_column(conn, 'shlokas', 'ordinal', 'INTEGER')
+    _create_model_index(conn, models.Shloka, 'ix_shlokas_ordinal')
+
+@migration(3, 'Add visitor shloka cursor')
+def add_visitor_shloka_cursor(conn):
+    _add_column(conn, 'visitors', 'shloka_cursor', 'INTEGER')
+
+@migration(4, 'Remove duplicate daily assignments and make them unique')
+def unique_daily_assignments(conn):
+    conn.execute(sa.text("""
+        DELETE FROM visitor_shlokas WHERE id NOT IN (
+            SELECT MIN(id) FROM visitor_shlokas GROUP BY visitor_id, date, shloka_id
+        )
+    """))
+    # Keep one progress row per day, completed if any duplicate was
+    conn.execute(sa.text("""
+        UPDATE daily_progress SET completed = :completed WHERE EXISTS (
+            SELECT 1 FROM daily_progress other
+            WHERE other.visitor_id = daily_progress.visitor_id
+              AND other.date = daily_progress.date
+              AND other.completed = :completed
+        )
+    """), {'completed': True})
+    conn.execute(sa.text("""
+        DELETE FROM daily_progress WHERE id NOT IN (
+            SELECT MIN(id) FROM daily_progress GROUP BY visitor_id, date
+        )
+    """))
+    _create_unique_index(
+        conn, 'visitor_shlokas', 'uq_visitor_shlokas_visitor_date_shloka',
+        ['visitor_id', 'date', 'shloka_id']
+    )
+    _create_unique_index(conn, 'daily_progress', 'uq_daily_progress_visitor_date', ['visitor_id', 'date'])
+
+@migration(5, 'Add composite indexes for visitor-scoped lookups')
+def add_visitor_indexes(conn):
+    _create_model_index(conn, models.Favorite, 'ix_favorites_visitor_shloka')
+    _create_model_index(conn, models.Quiz, 'ix_quizzes_visitor_date')
+    _create_model_index(conn, models.QuizQuestion, 'ix_quiz_questions_quiz_id')
+
+@migration(6, 'Store quiz answers and options as shloka ids instead of verse text')
+def quiz_options_as_ids(conn):
+    shloka_by_text = {}
+    for shloka_id, sanskrit, english in conn.execute(sa.text("SELECT id, sanskrit, english FROM shlokas")):
+        shloka_by_text[sanskrit] = shloka_id
+        shloka_by_text[english] = shloka_id
+
+    # Rewrite in batches; rows whose answer is already their shloka id are done
+    last_id = 0
+    while True:
+        rows = conn.execute(sa.text("""
+            SELECT id, shloka_id, correct_answer, options, user_answer FROM quiz_questions
+            WHERE id > :last_id ORDER BY id LIMIT 1000
+        """), {'last_id': last_id}).all()
+        if not rows:
+            break
+        last_id = rows[-1].id
+
+        updates = [{
+            'id': row.id,
+            'correct_answer': row.shloka_id,
+            'options': json.dumps([shloka_by_text.get(o, o) for o in json.loads(row.options)]),
+            'user_answer': shloka_by_text.get(row.user_answer, row.user_answer),
+        } for row in rows if row.correct_answer != row.shloka_id]
+        if updates:
+            conn.execute(sa.text("""
+                UPDATE quiz_questions
+                SET correct_answer = :correct_answer, options = :options, user_answer = :user_answer
+                WHERE id = :id
+            """), updates)
+
+@migration(7, 'Add application state table')
+def add_app_state(conn):
+    models.AppState.__table__.create(bind=conn, checkfirst=True)
+
+@migration(8, 'Add visitor state version for HTTP caching')
+def add_visitor_state_version(conn):
+    _add_column(conn, 'visitors', 'state_version', "INTEGER NOT NULL DEFAULT 0")
+
+@migration(9, 'Add notification bookkeeping and index visitors by notification time')
+def add_notification_schedule(conn):
+    _add_column(conn, 'visitors', 'last_notified_on', 'DATE')
+    # Replaced by ix_visitors_notification_time_zone in migration 13
+    conn.execute(sa.text("CREATE INDEX IF NOT EXISTS ix_visitors_notification_time ON visitors (notification_time, id)"))
+
+@migration(10, 'Add spaced-repetition review states, replayed from past quiz answers')
+def add_review_states(conn):
+    models.ReviewState.__table__.create(bind=conn, checkfirst=True)
+
+    # Replay each visitor's answers in the order they were given
+    rows = conn.execution_options(stream_results=True).execute(sa.text("""
+        SELECT quizzes.visitor_id, quizzes.date, quiz_questions.shloka_id, quiz_questions.is_correct
+        FROM quiz_questions JOIN quizzes ON quizzes.id = quiz_questions.quiz_id
+        WHERE quiz_questions.is_correct IS NOT NULL
+        ORDER BY quizzes.visitor_id, quizzes.date, quiz_questions.id
+    """))
+    insert = models.dialect_insert(models.ReviewState).on_conflict_do_nothing(
+        index_elements=['visitor_id', 'shloka_id']
+    )
+    batch = []
+    visitor_id = None
+    states = {}
+
+    def finish_visitor():
+        for shloka_id, (easiness, interval, repetitions, due_date, last_reviewed) in states.items():
+            batch.append({
+                'visitor_id': visitor_id, 'shloka_id': shloka_id, 'easiness': easiness, 'interval': interval,
+                'repetitions': repetitions, 'due_date': due_date, 'last_reviewed': last_reviewed,
+            })
+
+    for row in rows:
+        if row.visitor_id != visitor_id:
+            finish_visitor()
+            if len(batch) >= 1000:
+                conn.execute(insert, batch)
+                batch = []
+            visitor_id, states = row.visitor_id, {}
+        day = row.date if isinstance(row.date, date) else date.fromisoformat(row.date)
+        easiness, interval, repetitions, _, _ = states.get(row.shloka_id, (review.INITIAL_EASINESS, 0, 0, None, None))
+        states[row.shloka_id] = review.schedule(
+            easiness, interval, repetitions, review.grade(bool(row.is_correct)), day
+        ) + (day,)
+    finish_visitor()
+    if batch:
+        conn.execute(insert, batch)
+
+@migration(11, 'Add completion bitmaps and streak counters, backfilled from daily progress')
+def add_completion_history(conn):
+    _add_column(conn, 'visitors', 'current_streak', 'INTEGER NOT NULL DEFAULT 0')
+    _add_column(conn, 'visitors', 'longest_streak', 'INTEGER NOT NULL DEFAULT 0')
+    _add_column(conn, 'visitors', 'last_completed_date', 'DATE')
+    models.ProgressYear.__table__.create(bind=conn, checkfirst=True)
+
+    rows = conn.execution_options(stream_results=True).execute(sa.text("""
+        SELECT visitor_id, date FROM daily_progress
+        WHERE completed
+        ORDER BY visitor_id, date
+    """))
+    update_streaks = sa.text("""
+        UPDATE visitors SET current_streak = :current, longest_streak = :longest, last_completed_date = :last
+        WHERE id = :visitor_id
+    """)
+    bitmaps, streaks = [], []
+    visitor_id = None
+    days = []
+
+    def finish_visitor():
+        if not days:
+            return
+        bitmaps.extend(history.bitmap_rows(visitor_id, days))
+        current, longest, last = history.compute_streaks(days)
+        streaks.append({'visitor_id': visitor_id, 'current': current, 'longest': longest, 'last': last})
+
+    def flush():
+        history.merge_completions(conn.execute, bitmaps)
+        if streaks:
+            conn.execute(update_streaks, streaks)
+        bitmaps.clear()
+        streaks.clear()
+
+    for row in rows:
+        if row.visitor_id != visitor_id:
+            finish_visitor()
+            if len(streaks) >= 1000:
+                flush()
+            visitor_id, days = row.visitor_id, []
+        days.append(row.date if isinstance(row.date, date) else date.fromisoformat(row.date))
+    finish_visitor()
+    flush()
+
+@migration(12, 'Add visitor notification timezone')
+def add_notification_timezone(conn):
+    _add_column(conn, 'visitors', 'notification_timezone', 'VARCHAR(64)')
+
+@migration(13, 'Index visitors by notification time and timezone')
+def index_notification_timezone(conn):
+    conn.execute(sa.text("DROP INDEX IF EXISTS ix_visitors_notification_time"))
+    _create_model_index(conn, models.Visitor, 'ix_visitors_notification_time_zone')
+
+def applied_versions(conn):
+    migration_metadata.create_all(conn)
+    return set(conn.scalars(sa.select(schema_migrations.c.version)))
+
+def pending_migrations(conn):
+    applied = applied_versions(conn)
+    return [m for m in sorted(MIGRATIONS, key=lambda m: m[0]) if m[0] not in applied]
+
+def upgrade():
+    """Apply all pending migrations, each in its own transaction"""
+    with app.app_context():
+        with db.engine.begin() as conn:
+            pending = pending_migrations(conn)
+
+        for version, description, fn in pending:
+            logger.info(f"Applying migration {version}: {description}")
+            with db.engine.begin() as conn:
+                fn(conn)
+                conn.execute(schema_migrations.insert().values(
+                    version=version,
+                    description=description,
+                    applied_at=datetime.now()
+                ))
+
+        if not pending:
+            logger.info("Database schema is up to date")
+        return len(pending)
+
+def status():
+    """Log applied and pending migrations"""
+    with app.app_context():
+        with db.engine.begin() as conn:
+            applied = applied_versions(conn)
+        for version, description, _ in sorted(MIGRATIONS, key=lambda m: m[0]):
+            state = 'applied' if version in applied else 'pending'
+            logger.info(f"{version:>4} {state:<8} {description}")
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    command = sys.argv[1] if len(sys.argv) > 1 else 'upgrade'
+    if command == 'upgrade':
+        upgrade()
+    elif command == 'status':
+        status()
+    else:
+        sys.exit(f"Unknown command: {command} (expected 'upgrade' or 'status')")
@@ -1,39 +1,71 @@
 from datetime import datetime
 from app import db
 from uuid import uuid4
+from sqlalchemy.dialects import postgresql, sqlite
 import random
 
+def dialect_insert(model):
+    """INSERT for the active database that supports ON CONFLICT upserts (SQLite and PostgreSQL)"""
+    if db.engine.dialect.name == 'postgresql':
+        return postgresql.insert(model)
+    return sqlite.insert(model)
+
 class Visitor(db.Model):
     """Simple visitor model to track users with just a session ID"""
     __tablename__ = 'visitors'
+    __table_args__ = (
+        db.Index('ix_visitors_notification_time_zone', 'notification_time', 'notification_timezone', 'id'),
+    )
     id = db.Column(db.String, primary_key=True, default=lambda: str(uuid4()))
     session_id = db.Column(db.String, nullable=False, unique=True)
     created_at = db.Column(db.DateTime, default=datetime.now)
-    last_visit = db.Column(db.DateTime, default=datetime.now, onupdate=datetime.now)
+    last_visit = db.Column(db.DateTime, default=datetime.now)  # Written in batches, see activity.py
     email = db.Column(db.String, nullable=True)  # Optional email for notifications
     
     # Progress and preferences
-    notification_time = db.Column(db.String, nullable=True)
+    notification_time = db.Column(db.String, nullable=True)  # Local 'HH:MM' to email the daily shlokas
+    notification_timezone = db.Column(db.String(64), nullable=True)  # IANA timezone of notification_time
+    last_notified_on = db.Column(db.Date, nullable=True)  # Day the last notification email was sent
     last_quiz_date = db.Column(db.Date, nullable=True)
     last_quiz_score = db.Column(db.Integer, nullable=True)
     last_shloka_date = db.Column(db.Date, nullable=True)
+    shloka_cursor = db.Column(db.Integer, nullable=True)  # Ordinal of the last assigned shloka
+    state_version = db.Column(db.Integer, nullable=False, default=0, server_default='0')  # Bumped on every change, drives ETags
+    current_streak = db.Column(db.Integer, nullable=False, default=0, server_default='0')  # Consecutive completed days up to last_completed_date
+    longest_streak = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    last_completed_date = db.Column(db.Date, nullable=True)
     
     # Relationships
     favorites = db.relationship('Favorite', backref='visitor', lazy=True)
     progress = db.relationship('DailyProgress', backref='visitor', lazy=True)
 
+    def bump_state_version(self):
+        """Mark the visitor's state as changed, invalidating cached responses"""
+        self.state_version = Visitor.state_version + 1
+
     @staticmethod
     def get_or_create(session_id):
-        """Get visitor by session_id or create a new one"""
-        visitor = Visitor.query.filter_by(session_id=session_id).first()
-        if not visitor:
-            visitor = Visitor(session_id=session_id)
-            db.session.add(visitor)
-            db.session.commit()
+        """Get visitor by session_id or create a new one.
+        
+        The insert returns the new row; only when a concurrent request for
+        the same session inserted first is the existing row read.
+        """
+        visitor = db.session.scalars(
+            dialect_insert(Visitor)
+            .values(id=str(uuid4()), session_id=session_id)
+            .on_conflict_do_nothing(index_elements=['session_id'])
+            .returning(Visitor)
+        ).first()
+        if visitor is None:
+            visitor = Visitor.query.filter_by(session_id=session_id).one()
+        db.session.commit()
         return visitor
 
 class Favorite(db.Model):
     __tablename__ = 'favorites'
+    __table_args__ = (
+        db.Index('ix_favorites_visitor_shloka', 'visitor_id', 'shloka_id'),
+    )
     id = db.Column(db.Integer, primary_key=True)
     visitor_id = db.Column(db.String, db.ForeignKey('visitors.id'), nullable=False)
     shloka_id = db.Column(db.String, nullable=False)
@@ -41,20 +73,47 @@ class Favorite(db.Model):
 
 class DailyProgress(db.Model):
     __tablename__ = 'daily_progress'
+    __table_args__ = (
+        db.UniqueConstraint('visitor_id', 'date', name='uq_daily_progress_visitor_date'),
+    )
     id = db.Column(db.Integer, primary_key=True)
     visitor_id = db.Column(db.String, db.ForeignKey('visitors.id'), nullable=False)
     date = db.Column(db.Date, nullable=False)
     completed = db.Column(db.Boolean, default=False)
     created_at = db.Column(db.DateTime, default=datetime.now)
     
+class ProgressYear(db.Model):
+    """A visitor's completed days for one year as a bitmap, see history.py.
+    
+    Day-of-year n (0-based) is bit n % 63 of column bits_<n // 63>; 63 bits
+    per column keep the values positive in signed 64-bit integers.
+    """
+    __tablename__ = 'progress_years'
+    __table_args__ = (
+        db.UniqueConstraint('visitor_id', 'year', name='uq_progress_years_visitor_year'),
+    )
+    id = db.Column(db.Integer, primary_key=True)
+    visitor_id = db.Column(db.String, db.ForeignKey('visitors.id'), nullable=False)
+    year = db.Column(db.Integer, nullable=False)
+    bits_0 = db.Column(db.BigInteger, nullable=False, default=0)
+    bits_1 = db.Column(db.BigInteger, nullable=False, default=0)
+    bits_2 = db.Column(db.BigInteger, nullable=False, default=0)
+    bits_3 = db.Column(db.BigInteger, nullable=False, default=0)
+    bits_4 = db.Column(db.BigInteger, nullable=False, default=0)
+    bits_5 = db.Column(db.BigInteger, nullable=False, default=0)
+
 class Shloka(db.Model):
     __tablename__ = 'shlokas'
     id = db.Column(db.String, primary_key=True)
     sanskrit = db.Column(db.Text, nullable=False)
     english = db.Column(db.Text, nullable=False)
+    ordinal = db.Column(db.Integer, nullable=True, unique=True, index=True)  # Position in reading order, set at load time
     
 class VisitorShloka(db.Model):
     __tablename__ = 'visitor_shlokas'
+    __table_args__ = (
+        db.UniqueConstraint('visitor_id', 'date', 'shloka_id', name='uq_visitor_shlokas_visitor_date_shloka'),
+    )
     id = db.Column(db.Integer, primary_key=True)
     visitor_id = db.Column(db.String, db.ForeignKey('visitors.id'), nullable=False)
     shloka_id = db.Column(db.String, db.ForeignKey('shlokas.id'), nullable=False)
@@ -62,6 +121,9 @@ class VisitorShloka(db.Model):
     
 class Quiz(db.Model):
     __tablename__ = 'quizzes'
+    __table_args__ = (
+        db.Index('ix_quizzes_visitor_date', 'visitor_id', 'date'),
+    )
     id = db.Column(db.Integer, primary_key=True)
     visitor_id = db.Column(db.String, db.ForeignKey('visitors.id'), nullable=False)
     date = db.Column(db.Date, nullable=False)
@@ -74,10 +136,33 @@ class Quiz(db.Model):
 class QuizQuestion(db.Model):
     __tablename__ = 'quiz_questions'
     id = db.Column(db.Integer, primary_key=True)
-    quiz_id = db.Column(db.Integer, db.ForeignKey('quizzes.id'), nullable=False)
+    quiz_id = db.Column(db.Integer, db.ForeignKey('quizzes.id'), nullable=False, index=True)
     shloka_id = db.Column(db.String, db.ForeignKey('shlokas.id'), nullable=False)
     question_type = db.Column(db.String, nullable=False)  # 'sanskrit_to_english' or 'english_to_sanskrit'
-    correct_answer = db.Column(db.String, nullable=False)
-    options = db.Column(db.Text, nullable=False)  # JSON string of options
-    user_answer = db.Column(db.String, nullable=True)
+    correct_answer = db.Column(db.String, nullable=False)  # Shloka id of the correct option
+    options = db.Column(db.Text, nullable=False)  # JSON list of option shloka ids
+    user_answer = db.Column(db.String, nullable=True)  # Shloka id of the chosen option
     is_correct = db.Column(db.Boolean, nullable=True)
+
+class ReviewState(db.Model):
+    """Spaced-repetition (SM-2) schedule for one visitor and shloka, updated from quiz answers"""
+    __tablename__ = 'review_states'
+    __table_args__ = (
+        db.UniqueConstraint('visitor_id', 'shloka_id', name='uq_review_states_visitor_shloka'),
+        db.Index('ix_review_states_visitor_due', 'visitor_id', 'due_date'),
+    )
+    id = db.Column(db.Integer, primary_key=True)
+    visitor_id = db.Column(db.String, db.ForeignKey('visitors.id'), nullable=False)
+    shloka_id = db.Column(db.String, db.ForeignKey('shlokas.id'), nullable=False)
+    easiness = db.Column(db.Float, nullable=False, default=2.5)
+    interval = db.Column(db.Integer, nullable=False, default=0)  # Days until the next review
+    repetitions = db.Column(db.Integer, nullable=False, default=0)  # Correct answers in a row
+    due_date = db.Column(db.Date, nullable=False)
+    last_reviewed = db.Column(db.Date, nullable=True)
+
+class AppState(db.Model):
+    """Key/value store for application bookkeeping, such as the loaded corpus checksum"""
+    __tablename__ = 'app_state'
+    key = db.Column(db.String, primary_key=True)
+    value = db.Column(db.String, nullable=True)
+    updated_at = db.Column(db.DateTime, default=datetime.now, onupdate=datetime.now)
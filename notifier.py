@@ -0,0 +1,297 @@
+import os
+import sys
+import time
+import queue
+import smtplib
+import logging
+import threading
+from collections import deque
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+from zoneinfo import ZoneInfo
+from email.message import EmailMessage
+from email.policy import SMTP
+from email.utils import parseaddr
+from app import app, db
+from models import Visitor
+from corpus import get_corpus
+from utils import (
+    NOTIFICATION_TIME_PATTERN, DEFAULT_NOTIFICATION_TIMEZONE, notification_timezones,
+    preview_daily_shlokas, last_assigned_ordinals
+)
+
+logger = logging.getLogger(__name__)
+
+# Visitors read per query, and emails in flight at once
+NOTIFY_PAGE_SIZE = int(os.environ.get('NOTIFY_PAGE_SIZE', '1000'))
+NOTIFY_WORKERS = int(os.environ.get('NOTIFY_WORKERS', '8'))
+# Attempts per email for temporary failures, with exponential backoff from NOTIFY_RETRY_DELAY seconds
+NOTIFY_ATTEMPTS = 3
+NOTIFY_RETRY_DELAY = 1.0
+
+# Messages LocalSMTP keeps before dropping the oldest
+LOCAL_OUTBOX_LIMIT = 1000
+
+class LocalSMTP:
+    """In-memory stand-in for an SMTP connection, for tests and benchmarks.
+
+    Only used when passed in explicitly, e.g. SMTPPool(connect=LocalSMTP).
+    The latest sent messages are kept in LocalSMTP.outbox as (recipient,
+    raw message) pairs.
+    """
+    outbox = deque(maxlen=LOCAL_OUTBOX_LIMIT)
+    _lock = threading.Lock()
+
+    def sendmail(self, from_addr, to_addrs, msg):
+        with self._lock:
+            self.outbox.extend((to, msg) for to in to_addrs)
+        return {}
+
+    def quit(self):
+        pass
+
+def smtp_configured():
+    return bool(os.environ.get('SMTP_HOST'))
+
+def connect_smtp():
+    """Open an SMTP connection configured from the environment.
+
+    SMTP_HOST (required), SMTP_PORT (default 587), SMTP_USER, SMTP_PASSWORD
+    and SMTP_STARTTLS (default on).
+    """
+    host = os.environ.get('SMTP_HOST')
+    if not host:
+        raise RuntimeError("SMTP_HOST is not set")
+    connection = smtplib.SMTP(host, int(os.environ.get('SMTP_PORT', '587')), timeout=30)
+    if os.environ.get('SMTP_STARTTLS', '1') == '1':
+        connection.starttls()
+    if os.environ.get('SMTP_USER'):
+        connection.login(os.environ['SMTP_USER'], os.environ.get('SMTP_PASSWORD', ''))
+    return connection
+
+class SMTPPool:
+    """Shares up to `size` open SMTP connections between sending threads.
+
+    Connections are opened on demand and reused; one that fails is closed
+    and replaced on next use.
+    """
+
+    def __init__(self, connect=connect_smtp, size=NOTIFY_WORKERS):
+        self._connect = connect
+        self._idle = queue.LifoQueue()
+        self._slots = threading.BoundedSemaphore(size)
+
+    @contextmanager
+    def connection(self):
+        with self._slots:
+            try:
+                connection = self._idle.get_nowait()
+            except queue.Empty:
+                connection = self._connect()
+            try:
+                yield connection
+            except Exception:
+                _close(connection)
+                raise
+            self._idle.put(connection)
+
+    def close(self):
+        while True:
+            try:
+                _close(self._idle.get_nowait())
+            except queue.Empty:
+                return
+
+def _close(connection):
+    try:
+        connection.quit()
+    except Exception:
+        pass
+
+def _is_permanent(error):
+    """Whether retrying can't help, e.g. a rejected address"""
+    if isinstance(error, smtplib.SMTPRecipientsRefused):
+        return True
+    return isinstance(error, smtplib.SMTPResponseException) and error.smtp_code >= 500
+
+def send_with_retries(pool, sender, recipient, data, attempts=NOTIFY_ATTEMPTS, delay=NOTIFY_RETRY_DELAY):
+    """Send one raw message, retrying temporary failures. Returns whether it was sent."""
+    for attempt in range(attempts):
+        try:
+            with pool.connection() as connection:
+                connection.sendmail(sender, [recipient], data)
+            return True
+        except (smtplib.SMTPException, OSError) as e:
+            if _is_permanent(e) or attempt == attempts - 1:
+                logger.warning(f"Could not send notification to {recipient}: {str(e)}")
+                return False
+            time.sleep(delay * 2 ** attempt)
+    return False
+
+def sender_address():
+    return os.environ.get('NOTIFY_FROM', 'Gita Daily <no-reply@localhost>')
+
+def render_message(body):
+    """Encode a message without its To header; rendering is shared by every recipient of the same body"""
+    message = EmailMessage()
+    message['Subject'] = "Your daily shlokas"
+    message['From'] = sender_address()
+    message.set_content(body)
+    return message.as_bytes(policy=SMTP)
+
+def address_message(email, rendered):
+    return f"To: {email}\r\n".encode('utf-8') + rendered
+
+def _is_deliverable(email):
+    # Addresses are stored as entered; never let one inject headers
+    return '@' in email and not any(c in email for c in '\r\n')
+
+def render_body(shlokas):
+    parts = ["Today's shlokas from the Bhagavad Gita:", ""]
+    for s in shlokas:
+        parts.extend([f"{s.chapter}.{s.verse}" if s.chapter else s.id, s.sanskrit, s.english, ""])
+    parts.append(f"Continue reading at {os.environ.get('APP_URL', 'http://localhost:5000').rstrip('/')}/dashboard")
+    return '\n'.join(parts)
+
+def dispatch(minute, day=None, pool=None, page_size=NOTIFY_PAGE_SIZE, workers=NOTIFY_WORKERS, timezones=None):
+    """Email today's shlokas to every visitor whose notification time is `minute` ('HH:MM').
+
+    `day` is the visitors' local date. Pass `timezones` to only notify
+    visitors in those timezones, as dispatch_due does. Visitors are read in pages ordered by id (keyset pagination over the
+    notification time index), with each page's shlokas worked out from the
+    visitors' cursors in memory rather than a query per visitor. Visitors
+    already notified on `day` are skipped, so a dispatch can safely be
+    repeated or resumed. Must run in an app context. Returns (sent, failed).
+    """
+    day = day or datetime.now().date()
+    corpus = get_corpus()
+    own_pool = pool is None
+    pool = pool or SMTPPool(size=workers)
+    sent = failed = 0
+    last_id = ''
+    messages = {}
+    sender = parseaddr(sender_address())[1]
+    zone_filter = db.true()
+    if timezones is not None:
+        zone_filter = Visitor.notification_timezone.in_(timezones)
+        if DEFAULT_NOTIFICATION_TIMEZONE in timezones:
+            zone_filter = db.or_(zone_filter, Visitor.notification_timezone.is_(None))
+
+    try:
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            while True:
+                page = db.session.execute(
+                    db.select(Visitor.id, Visitor.email, Visitor.shloka_cursor, Visitor.last_shloka_date)
+                    .where(
+                        Visitor.notification_time == minute,
+                        zone_filter,
+                        Visitor.id > last_id,
+                        Visitor.email.isnot(None),
+                        Visitor.email != '',
+                        db.or_(Visitor.last_notified_on.is_(None), Visitor.last_notified_on < day)
+                    )
+                    .order_by(Visitor.id)
+                    .limit(page_size)
+                ).all()
+                if not page:
+                    break
+                last_id = page[-1].id
+
+                legacy = last_assigned_ordinals(
+                    [(v.id, v.last_shloka_date) for v in page
+                     if v.shloka_cursor is None and v.last_shloka_date is not None],
+                    corpus
+                )
+                futures = {}
+                for v in page:
+                    if not _is_deliverable(v.email):
+                        continue
+                    cursor = v.shloka_cursor if v.shloka_cursor is not None else legacy.get(v.id)
+                    shlokas = preview_daily_shlokas(cursor, v.last_shloka_date, corpus, day)
+                    if not shlokas:
+                        continue
+                    # Visitors at the same place in the reading share a rendered message
+                    rendered = messages.get(shlokas[0].ordinal)
+                    if rendered is None:
+                        rendered = messages[shlokas[0].ordinal] = render_message(render_body(shlokas))
+                    data = address_message(v.email, rendered)
+                    futures[v.id] = executor.submit(send_with_retries, pool, sender, v.email, data)
+
+                delivered = [visitor_id for visitor_id, future in futures.items() if future.result()]
+                failed += len(futures) - len(delivered)
+                sent += len(delivered)
+                if delivered:
+                    db.session.execute(
+                        db.update(Visitor)
+                        .where(Visitor.id.in_(delivered))
+                        .values(last_notified_on=day)
+                        .execution_options(synchronize_session=False)
+                    )
+                db.session.commit()
+    finally:
+        if own_pool:
+            pool.close()
+
+    if sent or failed:
+        logger.info(f"Notifications for {minute}: {sent} sent, {failed} failed")
+    return sent, failed
+
+def local_minutes(utc_minute):
+    """Group the known timezones by the local ('HH:MM', date) they have at a UTC minute"""
+    groups = {}
+    for name in notification_timezones():
+        local = utc_minute.astimezone(ZoneInfo(name))
+        groups.setdefault((local.strftime('%H:%M'), local.date()), []).append(name)
+    return groups
+
+def dispatch_due(utc_minute, pool=None):
+    """Notify every visitor whose local notification time falls on a UTC minute. Returns (sent, failed)."""
+    sent = failed = 0
+    for (minute, day), timezones in local_minutes(utc_minute).items():
+        group_sent, group_failed = dispatch(minute, day, pool=pool, timezones=timezones)
+        sent += group_sent
+        failed += group_failed
+    return sent, failed
+
+def run_scheduler():
+    """Dispatch notifications at the start of every UTC minute, forever.
+
+    Minutes missed while a large dispatch was running are caught up
+    afterwards. Run a single scheduler process per database.
+    """
+    pool = SMTPPool()
+    previous = None
+    try:
+        while True:
+            now = datetime.now(timezone.utc).replace(second=0, microsecond=0)
+            minute = now if previous is None else previous + timedelta(minutes=1)
+            while minute <= now:
+                with app.app_context():
+                    try:
+                        dispatch_due(minute, pool=pool)
+                    except Exception:
+                        # Keep scheduling; a later `send` can retry the minute, as
+                        # visitors notified before the error are skipped
+                        logger.exception(f"Notification dispatch for {minute:%H:%M} UTC failed")
+                        db.session.rollback()
+                previous = minute
+                minute += timedelta(minutes=1)
+            time.sleep(max(0.0, (now + timedelta(minutes=1) - datetime.now(timezone.utc)).total_seconds()))
+    finally:
+        pool.close()
+
+if __name__ == "__main__":
+    command = sys.argv[1] if len(sys.argv) > 1 else 'run'
+    if command in ('run', 'send') and not smtp_configured():
+        sys.exit("SMTP_HOST is not set; configure SMTP_HOST (and SMTP_PORT, SMTP_USER, SMTP_PASSWORD) to send notifications")
+    if command == 'run':
+        run_scheduler()
+    elif command == 'send' and len(sys.argv) > 2 and NOTIFICATION_TIME_PATTERN.match(sys.argv[2]):
+        hours, minutes = map(int, sys.argv[2].split(':'))
+        utc_minute = datetime.now(timezone.utc).replace(hour=hours, minute=minutes, second=0, microsecond=0)
+        with app.app_context():
+            sent, failed = dispatch_due(utc_minute)
+        print(f"{sent} notifications sent, {failed} failed.")
+    else:
+        sys.exit("Usage: python notifier.py [run | send HH:MM (UTC)]")
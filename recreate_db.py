@@ -1,6 +1,7 @@
 import os
 import logging
 from app import app, db
+from migrations import migration_metadata, upgrade
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
@@ -10,15 +11,17 @@ def recreate_database():
     """
     Drops all tables and recreates them.
     Use with caution as this will delete all data.
+    To update an existing database in place, run `python migrations.py` instead.
     """
     with app.app_context():
         logger.info("Dropping all tables...")
         db.drop_all()
-        
-        logger.info("Creating all tables...")
-        db.create_all()
-        
-        logger.info("Database tables have been recreated successfully.")
+        migration_metadata.drop_all(db.engine)
+    
+    logger.info("Creating all tables...")
+    upgrade()
+    
+    logger.info("Database tables have been recreated successfully.")
 
 if __name__ == "__main__":
     recreate_database()
\ No newline at end of file
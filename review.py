@@ -0,0 +1,38 @@
+from datetime import timedelta
+
+# SM-2 parameters
+INITIAL_EASINESS = 2.5
+MIN_EASINESS = 1.3
+
+# Quiz answers graded on SM-2's 0-5 recall scale
+CORRECT_QUALITY = 4
+INCORRECT_QUALITY = 1
+# Review cards read through on a day marked complete count as a hard recall
+REVIEWED_QUALITY = 3
+
+# Due verses mixed into a day's shlokas, and into a weekly quiz
+DAILY_REVIEW_COUNT = 3
+QUIZ_REVIEW_COUNT = 2
+
+def schedule(easiness, interval, repetitions, quality, today):
+    """Apply one SM-2 review graded `quality` (0-5).
+    
+    Returns the new (easiness, interval, repetitions, due date). A failed
+    recall (quality below 3) starts the verse over at a one-day interval.
+    """
+    if quality < 3:
+        repetitions = 0
+        interval = 1
+    else:
+        if repetitions == 0:
+            interval = 1
+        elif repetitions == 1:
+            interval = 6
+        else:
+            interval = round(interval * easiness)
+        repetitions += 1
+    easiness = max(MIN_EASINESS, easiness + 0.1 - (5 - quality) * (0.08 + (5 - quality) * 0.02))
+    return easiness, interval, repetitions, today + timedelta(days=interval)
+
+def grade(is_correct):
+    return CORRECT_QUALITY if is_correct else INCORRECT_QUALITY
@@ -1,53 +1,130 @@
-import os
-import json
+import re
 import uuid
-from datetime import datetime, date, timedelta
-from flask import render_template, request, redirect, url_for, jsonify, session
-import pandas as pd
+from datetime import date, timedelta
+from flask import render_template, request, jsonify, session, g
 from app import app, db
-from models import Visitor, Shloka, Favorite, VisitorShloka, Quiz, QuizQuestion, DailyProgress
+from models import Visitor, Favorite
+from corpus import get_corpus
+from activity import last_seen
+from http_cache import conditional, make_etag
+from cache import cached_view
+from startup import is_ready
+from metrics import render_metrics, metrics_enabled, metrics_authorized
+from corpus_bundles import send_bundle
 from utils import (
-    load_shlokas_from_csv, 
     get_daily_shlokas, 
     mark_daily_progress_complete,
-    get_weekly_progress,
-    is_quiz_unlocked,
+    get_weekly_summary,
+    get_favorite_ids,
     generate_weekly_quiz,
+    serialize_quiz_question,
     submit_quiz_answers,
-    get_initial_shlokas
+    get_due_reviews,
+    get_due_reviews_and_favorites,
+    get_initial_shlokas,
+    notification_timezones,
+    NOTIFICATION_TIME_PATTERN
 )
+from review import DAILY_REVIEW_COUNT, QUIZ_REVIEW_COUNT
+from history import streaks
 
-# Before request middleware to handle sessions
-@app.before_request
-def before_request():
-    # Create session ID if it doesn't exist
+# User agents that never get a visitor session
+BOT_USER_AGENT = re.compile(r'bot|crawl|spider|slurp|preview|monitor|curl|wget|python-requests', re.IGNORECASE)
+
+def ensure_session_id():
+    """Give the browser a visitor session id if it doesn't have one yet"""
     if 'session_id' not in session:
         session['session_id'] = str(uuid.uuid4())
         
-    # Set permanent session (30 days)
-    session.permanent = True
+        # Set permanent session (30 days)
+        session.permanent = True
+    return session['session_id']
 
-# Load shlokas on startup
-# Note: before_first_request is deprecated in newer Flask versions
-# Using a function that runs with app context instead
-def load_initial_data():
-    with app.app_context():
-        load_shlokas_from_csv()
+# Before request middleware to handle sessions
+@app.before_request
+def before_request():
+    # Only page views by browsers get a session; static assets, API calls
+    # and crawlers don't need one (API writes create it on demand)
+    if request.endpoint in (None, 'static') or request.path.startswith(('/api/', '/health/', '/metrics', '/corpus/')):
+        return
+    if BOT_USER_AGENT.search(request.user_agent.string or ''):
+        return
+    ensure_session_id()
 
-# Call load_initial_data when this module is imported
-load_initial_data()
-    
 # Helper function to get the current visitor
-def get_current_visitor():
-    if 'session_id' in session:
-        return Visitor.get_or_create(session['session_id'])
-    return None
+def get_current_visitor(create=False):
+    """Get the visitor for this request, cached for the rest of the request.
+    
+    Visitor rows are only created when `create` is set. State-changing
+    endpoints pass it, as do the daily shlokas and dashboard endpoints for
+    sessions started by a page view, since they assign the day's shlokas.
+    Other read-only endpoints treat unknown sessions as anonymous.
+    """
+    visitor = None
+    if 'visitor' in g:
+        if g.visitor is not None or not create:
+            return g.visitor
+        # Already looked up earlier in this request and not found
+    else:
+        if 'visitor_id' in session:
+            visitor = db.session.get(Visitor, session['visitor_id'])
+        if visitor is None and 'session_id' in session:
+            visitor = Visitor.query.filter_by(session_id=session['session_id']).first()
+    if visitor is None and create:
+        visitor = Visitor.get_or_create(ensure_session_id())
+    
+    if visitor is not None:
+        if session.get('visitor_id') != visitor.id:
+            session['visitor_id'] = visitor.id
+        last_seen.touch(visitor.id)
+    g.visitor = visitor
+    return visitor
+
+def has_visitor_session():
+    """Whether the request carries a session that may belong to a visitor"""
+    return 'session_id' in session or 'visitor_id' in session
+
+def visitor_etag(resource):
+    """ETag function for a per-visitor resource that changes daily or when the visitor's state does"""
+    def etag():
+        visitor = get_current_visitor()
+        if visitor is None:
+            return make_etag(resource, 'anonymous', date.today(), get_corpus().version)
+        return make_etag(resource, visitor.id, visitor.state_version, date.today(), get_corpus().version)
+    return etag
+
+@app.route('/health/ready')
+def health_ready():
+    """Readiness probe: 200 once the schema and a non-empty corpus are prepared"""
+    if not is_ready():
+        return jsonify({'ready': False}), 503
+    shloka_count = len(get_corpus())
+    return jsonify({
+        'ready': shloka_count > 0,
+        'shlokas': shloka_count
+    }), 200 if shloka_count else 503
+
+@app.route('/metrics')
+def metrics():
+    """Request, query and cache metrics for this worker process, in Prometheus text format"""
+    if not metrics_enabled():
+        return jsonify({'error': 'Not found'}), 404
+    if not metrics_authorized():
+        return jsonify({'error': 'Unauthorized'}), 401, {'WWW-Authenticate': 'Bearer'}
+    return render_metrics(), 200, {'Content-Type': 'text/plain; version=0.0.4; charset=utf-8'}
+
+@app.route('/corpus/<filename>')
+def corpus_bundle(filename):
+    """A content-hashed chapter of verse text, cached by browsers for good"""
+    return send_bundle(filename)
 
 @app.route('/')
+@cached_view(ttl=300, key=lambda: get_corpus().version)
 def index():
     """Main page / Landing page"""
     # Get the first shloka to show on landing page
-    random_shloka = get_initial_shlokas(1)[0] if Shloka.query.count() > 0 else None
+    initial_shlokas = get_initial_shlokas(1)
+    random_shloka = initial_shlokas[0] if initial_shlokas else None
     
     return render_template(
         'index.html',
@@ -79,9 +156,10 @@ def api_register_email():
     if not data or 'email' not in data:
         return jsonify({'error': 'Email is required'}), 400
     
-    visitor = get_current_visitor()
+    visitor = get_current_visitor(create=True)
     if visitor:
         visitor.email = data['email']
+        visitor.bump_state_version()
         db.session.commit()
         
         return jsonify({
@@ -91,56 +169,126 @@ def api_register_email():
     
     return jsonify({'error': 'Session not found'}), 400
 
-@app.route('/api/shlokas/daily', methods=['GET'])
-def api_daily_shlokas():
-    """API endpoint to get daily shlokas"""
-    visitor = get_current_visitor()
-    
+def daily_shloka_items(visitor):
+    """Today's shlokas for a visitor (or the opening ones for anonymous requests) as API items"""
     if visitor:
-        shlokas = get_daily_shlokas(visitor.id)
-        
-        return jsonify({
-            'shlokas': [{
-                'id': s.id,
-                'sanskrit': s.sanskrit,
-                'english': s.english,
-                'isFavorite': Favorite.query.filter_by(
-                    visitor_id=visitor.id,
-                    shloka_id=s.id
-                ).first() is not None
-            } for s in shlokas]
-        })
+        shlokas = get_daily_shlokas(visitor)
+        # Verses due for spaced-repetition review follow the new ones
+        reviews, favorite_ids = get_due_reviews_and_favorites(visitor, [s.id for s in shlokas])
+        review_ids = {s.id for s in reviews}
+        shlokas = shlokas + reviews
     else:
         # For non-logged in users, return initial shlokas
         shlokas = get_initial_shlokas(5)
-        print(f"Delivering these shlokas: {[s.id for s in shlokas]}")
-        
-        return jsonify({
-            'shlokas': [{
-                'id': s.id,
-                'sanskrit': s.sanskrit,
-                'english': s.english,
-                'isFavorite': False
-            } for s in shlokas]
-        })
+        review_ids = favorite_ids = set()
+    
+    # Only ids; pages look up the verse text in the static corpus bundles
+    return [{
+        'id': s.id,
+        'isFavorite': s.id in favorite_ids,
+        'isReview': s.id in review_ids
+    } for s in shlokas]
+
+def weekly_progress(visitor):
+    """The visitor's last 7 days, quiz unlock state and streak, as returned by the API"""
+    if not visitor:
+        # Empty progress for non-logged in users
+        today = date.today()
+        return {
+            'progress': [{
+                'date': (today - timedelta(days=6-i)).strftime('%Y-%m-%d'),
+                'completed': False,
+                'is_today': i == 6
+            } for i in range(7)],
+            'quizUnlocked': False,
+            'streak': {'current': 0, 'longest': 0}
+        }
+    
+    return progress_response(get_weekly_summary(visitor.id), streaks(visitor))
+
+def progress_response(summary, streak):
+    """API fields for a weekly summary and a (current, longest) streak"""
+    current_streak, longest_streak = streak
+    return {
+        'progress': summary['progress'],
+        'quizUnlocked': summary['quiz_unlocked'],
+        'streak': {'current': current_streak, 'longest': longest_streak}
+    }
+
+@app.route('/api/shlokas/daily', methods=['GET'])
+@conditional(visitor_etag('daily'))
+@cached_view(ttl=300, key=lambda: get_corpus().version, unless=has_visitor_session)
+def api_daily_shlokas():
+    """API endpoint to get daily shlokas"""
+    visitor = get_current_visitor(create='session_id' in session)
+    
+    return jsonify({'shlokas': daily_shloka_items(visitor)})
+
+@app.route('/api/dashboard/bootstrap', methods=['GET'])
+@conditional(visitor_etag('bootstrap'))
+def api_dashboard_bootstrap():
+    """API endpoint with everything the dashboard shows on load, from a single visitor load"""
+    visitor = get_current_visitor(create='session_id' in session)
+    
+    return jsonify({
+        'shlokas': daily_shloka_items(visitor),
+        **weekly_progress(visitor),
+        'notificationTime': visitor.notification_time if visitor else None
+    })
+
+def search_etag():
+    return make_etag(
+        'search', request.args.get('q', ''), request.args.get('limit', ''),
+        request.args.get('transliterate', ''), get_corpus().version
+    )
+
+@app.route('/api/shlokas/search', methods=['GET'])
+@conditional(search_etag, cache_control='public, max-age=3600')
+def api_search_shlokas():
+    """API endpoint to search the shlokas in Sanskrit and English"""
+    query = request.args.get('q', '').strip()[:200]
+    limit = request.args.get('limit', 20, type=int)
+    limit = max(1, min(limit, 50))
+    transliterate = request.args.get('transliterate', '1') != '0'
+    
+    results = get_corpus().search_index.search(query, limit=limit, transliterate=transliterate) if query else []
+    
+    return jsonify({
+        'query': query,
+        'results': [{
+            'id': s.id,
+            'sanskrit': s.sanskrit,
+            'english': s.english,
+            'score': round(score, 3)
+        } for s, score in results]
+    })
 
 @app.route('/api/shlokas/mark-complete', methods=['POST'])
 def api_mark_complete():
     """API endpoint to mark daily progress as complete"""
-    visitor = get_current_visitor()
+    visitor = get_current_visitor(create=True)
     
     if not visitor:
         return jsonify({'error': 'Session not found'}), 400
     
-    progress = mark_daily_progress_complete(visitor.id)
+    # Ids of the review cards shown with today's shlokas, which this reschedules
+    data = request.get_json(silent=True) or {}
+    reviewed = data.get('reviewed', [])
+    if not isinstance(reviewed, list) or not all(isinstance(i, str) for i in reviewed):
+        return jsonify({'error': 'Invalid data'}), 400
+    
+    today, summary, streak = mark_daily_progress_complete(visitor, reviewed[:DAILY_REVIEW_COUNT])
     
+    # The updated progress comes back too, so the page needn't fetch it again
     return jsonify({
         'success': True,
-        'date': progress.date.strftime('%Y-%m-%d'),
-        'completed': progress.completed
+        'date': today.strftime('%Y-%m-%d'),
+        'completed': True,
+        **progress_response(summary, streak)
     })
 
 @app.route('/api/favorites', methods=['GET'])
+@conditional(visitor_etag('favorites'))
 def api_get_favorites():
     """API endpoint to get user favorites"""
     visitor = get_current_visitor()
@@ -148,23 +296,16 @@ def api_get_favorites():
     if not visitor:
         return jsonify({'favorites': []})
     
-    favorites = Favorite.query.filter_by(visitor_id=visitor.id).all()
-    shloka_ids = [f.shloka_id for f in favorites]
-    
-    shlokas = Shloka.query.filter(Shloka.id.in_(shloka_ids)).all() if shloka_ids else []
+    shlokas = get_corpus().get_many(get_favorite_ids(visitor.id))
     
     return jsonify({
-        'favorites': [{
-            'id': s.id,
-            'sanskrit': s.sanskrit,
-            'english': s.english
-        } for s in shlokas]
+        'favorites': [{'id': s.id} for s in shlokas]
     })
 
 @app.route('/api/favorites/toggle', methods=['POST'])
 def api_toggle_favorite():
     """API endpoint to toggle favorite status"""
-    visitor = get_current_visitor()
+    visitor = get_current_visitor(create=True)
     
     if not visitor:
         return jsonify({'error': 'Session not found'}), 400
@@ -195,6 +336,7 @@ def api_toggle_favorite():
         db.session.add(favorite)
         is_favorite = True
     
+    visitor.bump_state_version()
     db.session.commit()
     
     return jsonify({
@@ -204,62 +346,29 @@ def api_toggle_favorite():
     })
 
 @app.route('/api/progress', methods=['GET'])
+@conditional(visitor_etag('progress'))
 def api_progress():
     """API endpoint to get weekly progress"""
-    visitor = get_current_visitor()
-    
-    if not visitor:
-        # Return empty progress for non-logged in users
-        today = date.today()
-        empty_progress = []
-        for i in range(7):
-            empty_progress.append({
-                'date': (today - timedelta(days=6-i)).strftime('%Y-%m-%d'),
-                'completed': False,
-                'is_today': i == 6
-            })
-        
-        return jsonify({
-            'progress': empty_progress,
-            'quizUnlocked': False
-        })
-    
-    progress_data = get_weekly_progress(visitor.id)
-    quiz_unlocked = is_quiz_unlocked(visitor.id)
-    
-    return jsonify({
-        'progress': progress_data,
-        'quizUnlocked': quiz_unlocked
-    })
+    return jsonify(weekly_progress(get_current_visitor()))
 
 @app.route('/api/quiz/generate', methods=['POST'])
 def api_generate_quiz():
     """API endpoint to generate weekly quiz"""
-    visitor = get_current_visitor()
+    visitor = get_current_visitor(create=True)
     
     if not visitor:
         return jsonify({'error': 'Session not found'}), 400
     
-    # Check if quiz is unlocked
-    if not is_quiz_unlocked(visitor.id):
-        # Generate a demo quiz for users who haven't completed enough days
-        quiz = generate_weekly_quiz(visitor.id)
-    else:
-        quiz = generate_weekly_quiz(visitor.id)
-    
-    questions = []
-    for q in quiz.questions:
-        options = json.loads(q.options)
-        questions.append({
-            'id': q.id,
-            'shloka_id': q.shloka_id,
-            'question_type': q.question_type,
-            'options': options
-        })
+    visitor.bump_state_version()
+    
+    # Visitors who haven't unlocked the weekly quiz get the same quiz as a demo
+    quiz = generate_weekly_quiz(visitor.id, reviews=get_due_reviews(visitor, limit=QUIZ_REVIEW_COUNT))
+    
+    corpus = get_corpus()
     
     return jsonify({
         'quiz_id': quiz.id,
-        'questions': questions
+        'questions': [serialize_quiz_question(q, corpus) for q in quiz.questions]
     })
 
 @app.route('/api/quiz/submit', methods=['POST'])
@@ -272,10 +381,15 @@ def api_submit_quiz():
     
     data = request.json
     
-    if not data or 'quiz_id' not in data or 'answers' not in data:
+    if not data or 'quiz_id' not in data or not isinstance(data.get('answers'), dict):
+        return jsonify({'error': 'Invalid data'}), 400
+    
+    try:
+        quiz_id = int(data['quiz_id'])
+    except (TypeError, ValueError):
         return jsonify({'error': 'Invalid data'}), 400
     
-    quiz = submit_quiz_answers(data['quiz_id'], data['answers'])
+    quiz = submit_quiz_answers(quiz_id, data['answers'], visitor)
     
     if not quiz:
         return jsonify({'error': 'Quiz not found'}), 404
@@ -290,32 +404,43 @@ def api_submit_quiz():
 @app.route('/api/user/notification-time', methods=['POST'])
 def api_set_notification_time():
     """API endpoint to set notification time"""
-    visitor = get_current_visitor()
+    visitor = get_current_visitor(create=True)
     
     if not visitor:
         return jsonify({'error': 'Session not found'}), 400
     
     data = request.json
     
-    if not data or 'time' not in data:
+    if not data or not NOTIFICATION_TIME_PATTERN.match(str(data.get('time', ''))):
         return jsonify({'error': 'Invalid data'}), 400
     
+    # The time is the browser's wall-clock time, in the browser's timezone
+    timezone = data.get('timezone')
+    if timezone is not None and timezone not in notification_timezones():
+        return jsonify({'error': 'Invalid timezone'}), 400
+    
     visitor.notification_time = data['time']
+    if timezone is not None:
+        visitor.notification_timezone = timezone
+    visitor.bump_state_version()
     db.session.commit()
     
     return jsonify({
         'success': True,
-        'notification_time': visitor.notification_time
+        'notification_time': visitor.notification_time,
+        'notification_timezone': visitor.notification_timezone
     })
 
 @app.route('/api/user/notification-time', methods=['GET'])
+@conditional(visitor_etag('notification-time'))
 def api_get_notification_time():
     """API endpoint to get notification time"""
     visitor = get_current_visitor()
     
     if not visitor:
-        return jsonify({'notification_time': None})
+        return jsonify({'notification_time': None, 'notification_timezone': None})
     
     return jsonify({
-        'notification_time': visitor.notification_time
+        'notification_time': visitor.notification_time,
+        'notification_timezone': visitor.notification_timezone
     })
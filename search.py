@@ -0,0 +1,185 @@
+import re
+import math
+import unicodedata
+from bisect import bisect_left
+
+# Dandas, the ASCII bars the corpus uses in their place, avagraha and verse numbers
+SANSKRIT_PUNCTUATION = re.compile(r'[।॥|ऽ०-९0-9]+')
+DEVANAGARI = re.compile(r'[ऀ-ॿ]')
+TOKEN = re.compile(r'\w+')
+# Letters, vowel signs and marks; \w alone would split words at vowel signs
+DEVANAGARI_WORD = re.compile(r'[ऀ-ॣॱ-ॿ]+')
+# "2.47", "2:47" or "c:2v47"
+VERSE_REFERENCE = re.compile(r'^\s*(?:c:)?(\d+)\s*(?:[.:]|v)\s*(\d+)\s*$', re.IGNORECASE)
+
+ENGLISH_STOPWORDS = frozenset(
+    'a an and are as at be by for from has he in is it its of on or that the to was were will with'.split()
+)
+
+# Devanagari to plain ASCII, close to IAST without diacritics
+_CONSONANTS = {
+    'क': 'k', 'ख': 'kh', 'ग': 'g', 'घ': 'gh', 'ङ': 'n',
+    'च': 'c', 'छ': 'ch', 'ज': 'j', 'झ': 'jh', 'ञ': 'n',
+    'ट': 't', 'ठ': 'th', 'ड': 'd', 'ढ': 'dh', 'ण': 'n',
+    'त': 't', 'थ': 'th', 'द': 'd', 'ध': 'dh', 'न': 'n',
+    'प': 'p', 'फ': 'ph', 'ब': 'b', 'भ': 'bh', 'म': 'm',
+    'य': 'y', 'र': 'r', 'ल': 'l', 'व': 'v', 'श': 's', 'ष': 's', 'स': 's', 'ह': 'h', 'ळ': 'l',
+}
+_VOWELS = {
+    'अ': 'a', 'आ': 'a', 'इ': 'i', 'ई': 'i', 'उ': 'u', 'ऊ': 'u', 'ऋ': 'r', 'ॠ': 'r',
+    'ऌ': 'l', 'ए': 'e', 'ऐ': 'ai', 'ओ': 'o', 'औ': 'au',
+}
+_VOWEL_SIGNS = {
+    'ा': 'a', 'ि': 'i', 'ी': 'i', 'ु': 'u', 'ू': 'u', 'ृ': 'r', 'ॄ': 'r',
+    'े': 'e', 'ै': 'ai', 'ो': 'o', 'ौ': 'au',
+}
+_VIRAMA = '्'
+_MARKS = {'ं': 'm', 'ँ': 'm', 'ः': 'h'}
+
+# Spelling differences that transliteration schemes and casual spellings disagree on
+_FOLDS = (
+    (re.compile(r'x'), 'ks'),
+    (re.compile(r'w'), 'v'),
+    (re.compile(r'([kgcjtdpb])h'), r'\1'),  # aspirates: bh, dh, kh, ...
+    (re.compile(r'sh'), 's'),
+    (re.compile(r'ri'), 'r'),
+    (re.compile(r'ee'), 'i'),
+    (re.compile(r'oo'), 'u'),
+    (re.compile(r'([aeiou])\1+'), r'\1'),  # long vowels typed as aa, ii, ...
+    (re.compile(r'm(?=[^aeiou])'), 'n'),  # anusvara before a consonant
+    (re.compile(r'(?<=..)[ah]$'), ''),  # final inherent a and visarga
+)
+
+def normalize_sanskrit(text):
+    """Devanagari text in NFC with dandas, bars and verse numbers removed"""
+    return SANSKRIT_PUNCTUATION.sub(' ', unicodedata.normalize('NFC', text))
+
+def romanize(word):
+    """Plain-ASCII romanization of a Devanagari word"""
+    out = []
+    inherent_a = False
+    for ch in word:
+        if ch in _CONSONANTS:
+            out.append(_CONSONANTS[ch] + 'a')
+            inherent_a = True
+        elif ch in _VOWEL_SIGNS or ch == _VIRAMA:
+            if inherent_a:
+                out[-1] = out[-1][:-1]
+            out.append(_VOWEL_SIGNS.get(ch, ''))
+            inherent_a = False
+        elif ch in _VOWELS:
+            out.append(_VOWELS[ch])
+            inherent_a = False
+        elif ch in _MARKS:
+            out.append(_MARKS[ch])
+            inherent_a = False
+    return ''.join(out)
+
+def fold(word):
+    """Reduce a romanized word to a spelling-insensitive key.
+
+    Diacritics are dropped, so IAST ("kṛṣṇa"), Harvard-Kyoto-like ("krSNa")
+    and everyday ("krishna") spellings all fold to the same key as the
+    romanized Devanagari.
+    """
+    word = ''.join(c for c in unicodedata.normalize('NFD', word.lower()) if not unicodedata.combining(c))
+    for pattern, replacement in _FOLDS:
+        word = pattern.sub(replacement, word)
+    return word
+
+def sanskrit_tokens(text):
+    return DEVANAGARI_WORD.findall(normalize_sanskrit(text))
+
+def english_tokens(text):
+    return [t for t in TOKEN.findall(text.lower()) if t not in ENGLISH_STOPWORDS]
+
+class SearchIndex:
+    """In-memory inverted index over the verses, ranked with BM25.
+
+    Terms are kept in three namespaces: English words, Devanagari words and
+    folded romanizations of the Devanagari words, so Latin-script queries
+    can match the Sanskrit text whatever transliteration they use.
+    """
+    K1 = 1.2
+    B = 0.75
+
+    def __init__(self, verses):
+        self._verses = tuple(verses)
+        postings = {}
+        lengths = []
+        for verse in self._verses:
+            terms = ['e:' + t for t in english_tokens(verse.english)]
+            for word in sanskrit_tokens(verse.sanskrit):
+                terms.append('s:' + word)
+                terms.append('t:' + fold(romanize(word)))
+            lengths.append(len(terms))
+            for term in terms:
+                counts = postings.setdefault(term, {})
+                counts[verse.ordinal] = counts.get(verse.ordinal, 0) + 1
+
+        total = len(self._verses) or 1
+        average_length = (sum(lengths) / len(lengths)) if lengths else 0
+        # BM25 length normalization per verse
+        self._norms = [self.K1 * (1 - self.B + self.B * length / average_length) for length in lengths]
+        self._by_reference = {(v.chapter, v.verse): v for v in self._verses if v.chapter is not None}
+        self._postings = {term: tuple(counts.items()) for term, counts in postings.items()}
+        self._idf = {
+            term: math.log(1 + (total - len(counts) + 0.5) / (len(counts) + 0.5))
+            for term, counts in self._postings.items()
+        }
+        self._vocabulary = sorted(self._postings)
+
+    def _expand(self, term, prefix):
+        """The indexed terms a query term matches; the last query word also matches as a prefix"""
+        if not prefix:
+            return [term] if term in self._postings else []
+        start = bisect_left(self._vocabulary, term)
+        matches = []
+        for indexed in self._vocabulary[start:start + 50]:
+            if not indexed.startswith(term):
+                break
+            matches.append(indexed)
+        return matches
+
+    def _query_alternatives(self, query, transliterate):
+        """Per query word, the terms any of which can satisfy it"""
+        words = []
+        if DEVANAGARI.search(query):
+            for word in sanskrit_tokens(query):
+                words.append(['s:' + word, 't:' + fold(romanize(word))] if transliterate else ['s:' + word])
+        else:
+            for word in english_tokens(query):
+                words.append(['e:' + word, 't:' + fold(word)] if transliterate else ['e:' + word])
+        return words
+
+    def search(self, query, limit=20, transliterate=True):
+        """Rank verses against a query; returns (verse, score) pairs, best first.
+
+        Verses matching more of the query words rank above those matching
+        fewer, then by BM25 score. A verse reference such as "2.47" returns
+        that verse.
+        """
+        reference = VERSE_REFERENCE.match(query)
+        if reference:
+            verse = self._by_reference.get((int(reference.group(1)), int(reference.group(2))))
+            return [(verse, 1.0)] if verse else []
+
+        words = self._query_alternatives(query, transliterate)
+        matched = {}
+        scores = {}
+        for position, alternatives in enumerate(words):
+            is_last = position == len(words) - 1
+            word_scores = {}
+            for alternative in alternatives:
+                for term in self._expand(alternative, prefix=is_last and len(alternative) > 4):
+                    idf = self._idf[term]
+                    for ordinal, tf in self._postings[term]:
+                        score = idf * tf * (self.K1 + 1) / (tf + self._norms[ordinal])
+                        if score > word_scores.get(ordinal, 0):
+                            word_scores[ordinal] = score
+            for ordinal, score in word_scores.items():
+                matched[ordinal] = matched.get(ordinal, 0) + 1
+                scores[ordinal] = scores.get(ordinal, 0.0) + score
+
+        ranked = sorted(scores, key=lambda o: (-matched[o], -scores[o], o))[:limit]
+        return [(self._verses[o], scores[o]) for o in ranked]
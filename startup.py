@@ -0,0 +1,45 @@
+import logging
+from threading import Event
+from app import app, db
+from migrations import upgrade
+from utils import load_shlokas_from_csv
+from corpus import get_corpus
+from corpus_bundles import build_bundles, bundle_manifest
+
+logger = logging.getLogger(__name__)
+
+_ready = Event()
+
+def prepare():
+    """Prepare the schema and corpus, build the in-memory indexes and the static corpus bundles.
+    
+    Call once per server before forking workers (gunicorn's preload_app),
+    so every worker inherits the loaded corpus copy-on-write instead of
+    building its own. Raises if the corpus can't be loaded or is empty, so
+    an instance without verses never reports ready.
+    """
+    if _ready.is_set():
+        return
+
+    upgrade()
+    with app.app_context():
+        load_shlokas_from_csv()
+        corpus = get_corpus()
+        if not len(corpus):
+            raise RuntimeError("No shlokas loaded; check the corpus CSV and the database")
+        try:
+            build_bundles(corpus)
+        except OSError as e:
+            # E.g. a read-only deploy whose bundles were built ahead of time
+            logger.warning(f"Could not write corpus bundles: {str(e)}")
+        # Workers inherit the bundle names along with the corpus
+        bundle_manifest()
+        # Don't hand open connections down to forked workers
+        db.engine.dispose()
+
+    logger.info(f"Startup complete: {len(corpus)} shlokas in memory")
+    _ready.set()
+
+def is_ready():
+    """Whether prepare() has finished in this process"""
+    return _ready.is_set()
@@ -0,0 +1,57 @@
+/**
+ * Verse Text for Gita Daily
+ * API responses carry shloka ids only; the text comes from per-chapter
+ * corpus bundles, whose URLs change with their content so the browser
+ * can cache them indefinitely
+ */
+
+const VERSE_ID_PATTERN = /^c:(\d+)v(\d+)$/;
+const bundleRequests = {};
+
+/**
+ * The bundle a shloka id belongs to: its chapter number, or 'other'
+ */
+function bundleKey(shlokaId) {
+    const match = VERSE_ID_PATTERN.exec(shlokaId);
+    return match ? String(parseInt(match[1], 10)) : 'other';
+}
+
+/**
+ * Fetch a chapter bundle once per page
+ */
+function loadBundle(key) {
+    const url = (window.CORPUS_BUNDLES || {})[key];
+    if (!url) return Promise.resolve({});
+    
+    if (!bundleRequests[key]) {
+        bundleRequests[key] = fetch(url)
+            .then(response => {
+                if (!response.ok) {
+                    throw new Error(`Corpus bundle ${key} returned ${response.status}`);
+                }
+                return response.json();
+            })
+            .catch(error => {
+                // Let a later call try again
+                delete bundleRequests[key];
+                throw error;
+            });
+    }
+    return bundleRequests[key];
+}
+
+/**
+ * Resolve shloka ids to their {sanskrit, english} text, fetching only the chapters needed
+ */
+function loadVerses(shlokaIds) {
+    const keys = [...new Set(shlokaIds.map(bundleKey))];
+    
+    return Promise.all(keys.map(loadBundle)).then(bundles => {
+        const verses = {};
+        shlokaIds.forEach(id => {
+            const bundle = bundles[keys.indexOf(bundleKey(id))];
+            verses[id] = bundle[id] || { sanskrit: '', english: '' };
+        });
+        return verses;
+    });
+}
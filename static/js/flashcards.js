@@ -4,11 +4,8 @@
  */
 
 document.addEventListener('DOMContentLoaded', function() {
-    // Initialize flashcards
-    initializeFlashcards();
-    
-    // Initialize notification settings
-    initializeNotificationSettings();
+    // Load flashcards, progress and notification settings in one request
+    initializeDashboard();
     
     // Event listener for mark complete button
     const markCompleteBtn = document.getElementById('mark-complete-btn');
@@ -18,67 +15,63 @@ document.addEventListener('DOMContentLoaded', function() {
 });
 
 /**
- * Initialize flashcards from API
+ * Load everything the dashboard shows from a single API call
  */
-function initializeFlashcards() {
-    // Fetch daily shlokas
-    fetch('/api/shlokas/daily')
+function initializeDashboard() {
+    fetch('/api/dashboard/bootstrap')
         .then(response => response.json())
         .then(data => {
-            if (data.shlokas && data.shlokas.length > 0) {
-                createFlashcards(data.shlokas);
-            } else {
-                const swiperContainer = document.querySelector('#shloka-swiper .swiper-wrapper');
-                swiperContainer.innerHTML = `
-                    <div class="swiper-slide">
-                        <div class="flashcard">
-                            <div class="flashcard-front">
-                                <div class="text-center">
-                                    <i class="fas fa-exclamation-triangle fa-3x text-warning mb-3"></i>
-                                    <h3>No Shlokas Available</h3>
-                                    <p>Please try again later.</p>
-                                </div>
-                            </div>
-                        </div>
-                    </div>
-                `;
+            showProgress(data);
+            initializeNotificationSettings(data.notificationTime);
+            
+            if (!data.shlokas || data.shlokas.length === 0) {
+                showFlashcardMessage('fa-exclamation-triangle text-warning', 'No Shlokas Available',
+                                     'Please try again later.');
+                return;
             }
+            
+            // The response only has ids; the text comes from the cached corpus bundles
+            loadVerses(data.shlokas.map(s => s.id))
+                .then(verses => createFlashcards(data.shlokas, verses))
+                .catch(error => {
+                    console.error('Error loading verse text:', error);
+                    showFlashcardMessage('fa-exclamation-circle text-danger', 'Failed to Load Shlokas',
+                                         'Please check your connection and try again.');
+                });
         })
         .catch(error => {
-            console.error('Error fetching shlokas:', error);
-            const swiperContainer = document.querySelector('#shloka-swiper .swiper-wrapper');
-            swiperContainer.innerHTML = `
-                <div class="swiper-slide">
-                    <div class="flashcard">
-                        <div class="flashcard-front">
-                            <div class="text-center">
-                                <i class="fas fa-exclamation-circle fa-3x text-danger mb-3"></i>
-                                <h3>Failed to Load Shlokas</h3>
-                                <p>Please check your connection and try again.</p>
-                            </div>
-                        </div>
+            console.error('Error loading dashboard:', error);
+            showFlashcardMessage('fa-exclamation-circle text-danger', 'Failed to Load Shlokas',
+                                 'Please check your connection and try again.');
+            showProgressError();
+            initializeNotificationSettings(null);
+        });
+}
+
+/**
+ * Show a message card in place of the flashcards
+ */
+function showFlashcardMessage(iconClasses, title, text) {
+    const swiperContainer = document.querySelector('#shloka-swiper .swiper-wrapper');
+    swiperContainer.innerHTML = `
+        <div class="swiper-slide">
+            <div class="flashcard">
+                <div class="flashcard-front">
+                    <div class="text-center">
+                        <i class="fas ${iconClasses} fa-3x mb-3"></i>
+                        <h3>${title}</h3>
+                        <p>${text}</p>
                     </div>
                 </div>
-            `;
-        });
-    
-    // Fetch progress
-    fetch('/api/progress')
-        .then(response => response.json())
-        .then(data => {
-            if (data.progress) {
-                updateProgressTracker(data.progress);
-            }
-        })
-        .catch(error => {
-            console.error('Error fetching progress:', error);
-        });
+            </div>
+        </div>
+    `;
 }
 
 /**
- * Create flashcards from shloka data
+ * Create flashcards from shloka data and their text, keyed by shloka id
  */
-function createFlashcards(shlokas) {
+function createFlashcards(shlokas, verses) {
     const swiperContainer = document.querySelector('#shloka-swiper .swiper-wrapper');
     swiperContainer.innerHTML = '';
     
@@ -87,10 +80,10 @@ function createFlashcards(shlokas) {
         slideElement.className = 'swiper-slide';
         
         slideElement.innerHTML = `
-            <div class="flashcard" data-shloka-id="${shloka.id}">
+            <div class="flashcard" data-shloka-id="${shloka.id}"${shloka.isReview ? ' data-review' : ''}>
                 <div class="flashcard-front">
-                    <div class="shloka-id">${shloka.id}</div>
-                    <div class="shloka-sanskrit">${shloka.sanskrit}</div>
+                    <div class="shloka-id">${shloka.id}${shloka.isReview ? ' · Review' : ''}</div>
+                    <div class="shloka-sanskrit">${verses[shloka.id].sanskrit}</div>
                     <button class="favorite-btn ${shloka.isFavorite ? 'active' : ''}" data-shloka-id="${shloka.id}">
                         <i class="fas fa-heart"></i>
                     </button>
@@ -98,7 +91,7 @@ function createFlashcards(shlokas) {
                 </div>
                 <div class="flashcard-back">
                     <div class="shloka-id">${shloka.id}</div>
-                    <div class="shloka-english">${shloka.english}</div>
+                    <div class="shloka-english">${verses[shloka.id].english}</div>
                     <button class="favorite-btn ${shloka.isFavorite ? 'active' : ''}" data-shloka-id="${shloka.id}">
                         <i class="fas fa-heart"></i>
                     </button>
@@ -191,33 +184,26 @@ function toggleFavorite(shlokaId, buttonElement) {
  * Mark today's reading as complete
  */
 function markDayAsComplete() {
+    // The review cards shown today are rescheduled along with the completion
+    const reviewed = Array.from(document.querySelectorAll('.flashcard[data-review]'),
+                                card => card.dataset.shlokaId);
+    
     fetch('/api/shlokas/mark-complete', {
         method: 'POST',
         headers: {
             'Content-Type': 'application/json',
-        }
+        },
+        body: JSON.stringify({ reviewed: reviewed })
     })
     .then(response => response.json())
     .then(data => {
         if (data.success) {
-            // Update UI to reflect completion
-            const markCompleteBtn = document.getElementById('mark-complete-btn');
-            markCompleteBtn.disabled = true;
-            markCompleteBtn.innerHTML = '<i class="fas fa-check-circle me-2"></i> Completed for Today';
-            
-            // Update progress display
-            fetch('/api/progress')
-                .then(response => response.json())
-                .then(progressData => {
-                    updateProgressTracker(progressData.progress);
-                    
-                    // Show notification about quiz if unlocked
-                    if (progressData.quizUnlocked) {
-                        showNotification('Weekly quiz is now available!', 'info');
-                    } else {
-                        showNotification('Progress saved! Keep up the good work!');
-                    }
-                });
+            // The response carries the updated progress; showProgress also
+            // disables the button and announces an unlocked quiz
+            showProgress(data);
+            if (!data.quizUnlocked) {
+                showNotification('Progress saved! Keep up the good work!');
+            }
         }
     })
     .catch(error => {
@@ -227,68 +213,16 @@ function markDayAsComplete() {
 }
 
 /**
- * Update the progress tracker with weekly data
+ * Initialize notification settings with the stored time, if any
  */
-function updateProgressTracker(progressData) {
-    const progressTracker = document.getElementById('progress-tracker');
-    if (!progressTracker) return;
-    
-    progressTracker.innerHTML = '';
-    
-    progressData.forEach(day => {
-        const dayElement = document.createElement('div');
-        dayElement.className = 'progress-day';
-        
-        const circleClass = day.completed ? 'progress-circle completed' : 'progress-circle';
-        const todayClass = day.is_today ? ' today' : '';
-        
-        const dayName = new Date(day.date).toLocaleDateString('en-US', { weekday: 'short' });
-        
-        dayElement.innerHTML = `
-            <div class="${circleClass}${todayClass}">
-                <i class="${day.completed ? 'fas fa-check' : ''}"></i>
-            </div>
-            <span class="progress-day-label">${dayName}</span>
-        `;
-        
-        progressTracker.appendChild(dayElement);
-    });
-    
-    // Check if today is completed and update button
-    const todayData = progressData.find(day => day.is_today);
-    if (todayData && todayData.completed) {
-        const markCompleteBtn = document.getElementById('mark-complete-btn');
-        if (markCompleteBtn) {
-            markCompleteBtn.disabled = true;
-            markCompleteBtn.innerHTML = '<i class="fas fa-check-circle me-2"></i> Completed for Today';
-        }
-    }
-}
-
-/**
- * Initialize notification settings
- */
-function initializeNotificationSettings() {
+function initializeNotificationSettings(notificationTime) {
     const timeInput = document.getElementById('notification-time');
     const saveButton = document.getElementById('save-notification-time');
     
     if (!timeInput || !saveButton) return;
     
-    // Fetch current notification time
-    fetch('/api/user/notification-time')
-        .then(response => response.json())
-        .then(data => {
-            if (data.notification_time) {
-                timeInput.value = data.notification_time;
-            } else {
-                // Default to 8 AM
-                timeInput.value = '08:00';
-            }
-        })
-        .catch(error => {
-            console.error('Error fetching notification time:', error);
-            timeInput.value = '08:00';
-        });
+    // Default to 8 AM
+    timeInput.value = notificationTime || '08:00';
     
     // Save notification time
     saveButton.addEventListener('click', function() {
@@ -305,7 +239,9 @@ function initializeNotificationSettings() {
                 'Content-Type': 'application/json',
             },
             body: JSON.stringify({
-                time: time
+                time: time,
+                // The server emails at this wall-clock time in the browser's timezone
+                timezone: Intl.DateTimeFormat().resolvedOptions().timeZone
             }),
         })
         .then(response => response.json())
@@ -1,47 +1,43 @@
 /**
  * Progress Tracking for Gita Daily
- * Handles weekly progress display and updates
+ * Handles weekly progress display and updates; the data comes from flashcards.js
  */
 
-document.addEventListener('DOMContentLoaded', function() {
-    // Check and update progress display
-    updateProgressDisplay();
-});
+/**
+ * Update progress display from the dashboard bootstrap or mark-complete response
+ */
+function showProgress(data) {
+    const progressTracker = document.getElementById('progress-tracker');
+    if (!progressTracker || !data.progress) return;
+    
+    renderProgressTracker(data.progress, progressTracker);
+    renderStreak(data.streak);
+    
+    // If quiz is unlocked, show notification
+    if (data.quizUnlocked) {
+        showQuizAvailableNotification();
+    }
+    
+    // Update complete button if today is already completed
+    const todayProgress = data.progress.find(day => day.is_today);
+    if (todayProgress && todayProgress.completed) {
+        updateCompletedButton();
+    }
+}
 
 /**
- * Update progress display based on API data
+ * Show that progress couldn't be loaded
  */
-function updateProgressDisplay() {
+function showProgressError() {
     const progressTracker = document.getElementById('progress-tracker');
     if (!progressTracker) return;
     
-    fetch('/api/progress')
-        .then(response => response.json())
-        .then(data => {
-            if (data.progress) {
-                renderProgressTracker(data.progress, progressTracker);
-                
-                // If quiz is unlocked, show notification
-                if (data.quizUnlocked) {
-                    showQuizAvailableNotification();
-                }
-                
-                // Update complete button if today is already completed
-                const todayProgress = data.progress.find(day => day.is_today);
-                if (todayProgress && todayProgress.completed) {
-                    updateCompletedButton();
-                }
-            }
-        })
-        .catch(error => {
-            console.error('Error fetching progress:', error);
-            progressTracker.innerHTML = `
-                <div class="alert alert-warning" role="alert">
-                    <i class="fas fa-exclamation-circle me-2"></i>
-                    Unable to load progress data.
-                </div>
-            `;
-        });
+    progressTracker.innerHTML = `
+        <div class="alert alert-warning" role="alert">
+            <i class="fas fa-exclamation-circle me-2"></i>
+            Unable to load progress data.
+        </div>
+    `;
 }
 
 /**
@@ -73,6 +69,18 @@ function renderProgressTracker(progressData, trackerElement) {
     });
 }
 
+/**
+ * Show the current and longest streak under the tracker
+ */
+function renderStreak(streak) {
+    const streakElement = document.getElementById('progress-streak');
+    if (!streakElement || !streak) return;
+    
+    streakElement.textContent = streak.current > 0
+        ? `${streak.current}-day streak · best ${streak.longest}`
+        : (streak.longest > 0 ? `Best streak: ${streak.longest} days` : '');
+}
+
 /**
  * Show notification that quiz is available
  */
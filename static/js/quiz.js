@@ -135,8 +135,9 @@ function generateQuiz() {
         quizStatusEl.classList.add('d-none');
         quizContentEl.classList.remove('d-none');
         
-        // Populate quiz questions
-        renderQuizQuestions(data);
+        // Populate quiz questions once their verse text is loaded
+        const shlokaIds = data.questions.flatMap(q => [q.shloka_id, ...q.options.map(o => o.id)]);
+        return loadVerses(shlokaIds).then(verses => renderQuizQuestions(data, verses));
     })
     .catch(error => {
         console.error('Error generating quiz:', error);
@@ -157,9 +158,9 @@ function generateQuiz() {
 }
 
 /**
- * Render quiz questions in the DOM
+ * Render quiz questions in the DOM, with verse text keyed by shloka id
  */
-function renderQuizQuestions(quizData) {
+function renderQuizQuestions(quizData, verses) {
     const questionsContainer = document.getElementById('quiz-questions');
     questionsContainer.innerHTML = '';
     
@@ -171,69 +172,48 @@ function renderQuizQuestions(quizData) {
         const questionElement = document.createElement('div');
         questionElement.className = 'quiz-question';
         
-        // Create header based on question type
+        // Create header based on question type; the prompt is in one language, the options in the other
         let questionHeader = '';
+        let promptField = 'sanskrit';
+        let optionField = 'english';
         if (question.question_type === 'sanskrit_to_english') {
             questionHeader = 'Translate this Sanskrit shloka to English:';
         } else {
             questionHeader = 'Match this English translation to its Sanskrit shloka:';
+            promptField = 'english';
+            optionField = 'sanskrit';
         }
         
-        // Fetch the actual question content
-        fetch(`/api/shlokas/daily`)
-            .then(response => response.json())
-            .then(data => {
-                // Find the shloka that matches this question
-                const shloka = data.shlokas.find(s => s.id === question.shloka_id);
-                
-                if (shloka) {
-                    // Create question content based on type
-                    const questionContent = question.question_type === 'sanskrit_to_english' 
-                        ? shloka.sanskrit 
-                        : shloka.english;
-                    
-                    // Create options
-                    let optionsHTML = '';
-                    question.options.forEach(option => {
-                        const optionId = `q${question.id}_${option.replace(/\s+/g, '_').substring(0, 10)}`;
-                        
-                        optionsHTML += `
-                            <div class="form-check">
-                                <input class="form-check-input" type="radio" name="question_${question.id}" 
-                                       id="${optionId}" value="${option}" required>
-                                <label class="form-check-label" for="${optionId}">
-                                    ${option}
-                                </label>
-                            </div>
-                        `;
-                    });
-                    
-                    // Build the complete question HTML
-                    questionElement.innerHTML = `
-                        <div class="question-header">
-                            <span class="question-number">Question ${index + 1}:</span> ${questionHeader}
-                        </div>
-                        <div class="question-content">
-                            ${questionContent}
-                        </div>
-                        <div class="question-options">
-                            ${optionsHTML}
-                        </div>
-                    `;
-                    
-                    questionsContainer.appendChild(questionElement);
-                }
-            })
-            .catch(error => {
-                console.error('Error fetching shloka details:', error);
-                questionElement.innerHTML = `
-                    <div class="alert alert-danger" role="alert">
-                        <i class="fas fa-exclamation-circle me-2"></i>
-                        Failed to load question ${index + 1}. Please try again later.
-                    </div>
-                `;
-                questionsContainer.appendChild(questionElement);
-            });
+        // Create options; each value is the shloka id of that option
+        let optionsHTML = '';
+        question.options.forEach(option => {
+            const optionId = `q${question.id}_${option.id.replace(/[^a-zA-Z0-9]/g, '_')}`;
+            
+            optionsHTML += `
+                <div class="form-check">
+                    <input class="form-check-input" type="radio" name="question_${question.id}" 
+                           id="${optionId}" value="${option.id}" required>
+                    <label class="form-check-label" for="${optionId}">
+                        ${verses[option.id][optionField]}
+                    </label>
+                </div>
+            `;
+        });
+        
+        // Build the complete question HTML
+        questionElement.innerHTML = `
+            <div class="question-header">
+                <span class="question-number">Question ${index + 1}:</span> ${questionHeader}
+            </div>
+            <div class="question-content">
+                ${verses[question.shloka_id][promptField]}
+            </div>
+            <div class="question-options">
+                ${optionsHTML}
+            </div>
+        `;
+        
+        questionsContainer.appendChild(questionElement);
     });
 }
 
@@ -1,221 +1,373 @@
-import pandas as pd
+import os
+import re
+import csv
+import hashlib
 import random
 import json
 from datetime import datetime, timedelta, date
+from functools import lru_cache
+from zoneinfo import available_timezones
+from sqlalchemy.orm import joinedload
 from app import app, db
-from models import Shloka, Visitor, DailyProgress, VisitorShloka, Quiz, QuizQuestion
+from models import Shloka, Visitor, Favorite, DailyProgress, VisitorShloka, Quiz, QuizQuestion, ReviewState, ProgressYear, AppState, dialect_insert
+from corpus import get_corpus, reset_corpus, compute_ordinals
+from cache import cached
+from review import INITIAL_EASINESS, DAILY_REVIEW_COUNT, REVIEWED_QUALITY, schedule, grade
+from history import record_completion, completed_days, streaks
 
-def load_shlokas_from_csv():
-    """Load shlokas from CSV file into the database"""
+CORPUS_CSV_PATH = './attached_assets/Gita-data.csv'
+CORPUS_CHECKSUM_KEY = 'shlokas_csv_sha256'
+
+# Shlokas assigned per visitor per day
+DAILY_SHLOKA_COUNT = 5
+
+# Notification times are stored as the visitor's chosen local 'HH:MM'
+NOTIFICATION_TIME_PATTERN = re.compile(r'^([01]\d|2[0-3]):[0-5]\d$')
+# Timezone assumed for notification times saved before timezones were stored
+DEFAULT_NOTIFICATION_TIMEZONE = os.environ.get('NOTIFY_DEFAULT_TIMEZONE', 'UTC')
+
+@lru_cache(maxsize=1)
+def notification_timezones():
+    """IANA timezone names a notification time can be given in"""
+    return frozenset(available_timezones())
+
+def read_shlokas_csv(path=CORPUS_CSV_PATH):
+    """Stream (id, sanskrit, english) rows from the shloka CSV"""
+    with open(path, newline='', encoding='utf-8') as f:
+        for row in csv.DictReader(f):
+            yield row['id'], row['SA'], row['EN']
+
+def file_checksum(path):
+    """SHA-256 of a file's contents"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(65536), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def load_shlokas_from_csv(path=CORPUS_CSV_PATH, force=False):
+    """Load shlokas from CSV file into the database
+    
+    Does nothing if the file is unchanged since the last load. Otherwise new
+    verses are inserted and changed ones updated, each in a single statement.
+    Returns the number of verses inserted or updated. Errors are logged
+    and re-raised after rolling back.
+    """
     try:
-        # Check if shlokas are already loaded
-        if db.session.query(Shloka).count() > 0:
-            return
+        checksum = file_checksum(path)
+        stored = db.session.get(AppState, CORPUS_CHECKSUM_KEY)
+        if stored and stored.value == checksum and not force:
+            return 0
+        
+        rows = list(read_shlokas_csv(path))
+        ordinals = compute_ordinals(shloka_id for shloka_id, _, _ in rows)
+        existing = {
+            row.id: (row.sanskrit, row.english, row.ordinal)
+            for row in db.session.execute(
+                db.select(Shloka.id, Shloka.sanskrit, Shloka.english, Shloka.ordinal)
+            )
+        }
         
-        # Load CSV file from attached_assets 
-        df = pd.read_csv('./attached_assets/Gita-data.csv')
+        inserts = []
+        updates = []
+        for shloka_id, sanskrit, english in rows:
+            values = {'id': shloka_id, 'sanskrit': sanskrit, 'english': english, 'ordinal': ordinals[shloka_id]}
+            if shloka_id not in existing:
+                inserts.append(values)
+            elif existing[shloka_id] != (sanskrit, english, ordinals[shloka_id]):
+                updates.append(values)
         
-        # Insert shlokas into database
-        for _, row in df.iterrows():
-            shloka = Shloka(
-                id=row['id'],
-                sanskrit=row['SA'],
-                english=row['EN']
+        # Clear ordinals that are about to move (or whose verse left the CSV)
+        # so reassigned positions can't collide on the unique column
+        stale_ids = [u['id'] for u in updates] + [i for i in existing if i not in ordinals]
+        if stale_ids:
+            db.session.execute(
+                db.update(Shloka).where(Shloka.id.in_(stale_ids)).values(ordinal=None)
+                .execution_options(synchronize_session=False)
             )
-            db.session.add(shloka)
+        if updates:
+            db.session.execute(db.update(Shloka), updates)
+        if inserts:
+            db.session.execute(db.insert(Shloka), inserts)
         
+        db.session.execute(
+            dialect_insert(AppState)
+            .values(key=CORPUS_CHECKSUM_KEY, value=checksum, updated_at=datetime.now())
+            .on_conflict_do_update(
+                index_elements=['key'],
+                set_={'value': checksum, 'updated_at': datetime.now()}
+            )
+        )
         db.session.commit()
-        app.logger.info(f"Loaded {len(df)} shlokas from CSV")
+        reset_corpus()
+        app.logger.info(f"Synced shlokas from CSV: {len(inserts)} inserted, {len(updates)} updated")
+        return len(inserts) + len(updates)
     except Exception as e:
         app.logger.error(f"Error loading shlokas: {str(e)}")
         db.session.rollback()
+        raise
 
-def get_daily_shlokas(visitor_id):
+def get_daily_shlokas(visitor):
     """Get 5 consecutive shlokas for the day based on visitor's progress"""
     today = date.today()
-    
-    # Check if visitor already has shlokas for today
-    visitor_shlokas = VisitorShloka.query.filter_by(
-        visitor_id=visitor_id, 
-        date=today
-    ).all()
-    
-    if visitor_shlokas:
-        # Return the shlokas that were already assigned
-        shloka_ids = [vs.shloka_id for vs in visitor_shlokas]
-        return Shloka.query.filter(Shloka.id.in_(shloka_ids)).order_by(Shloka.id).all()
-    
-    # Get the last assigned shloka for this visitor
-    last_assigned = VisitorShloka.query.filter_by(
-        visitor_id=visitor_id
-    ).join(Shloka, VisitorShloka.shloka_id == Shloka.id).order_by(VisitorShloka.date.desc(), Shloka.id.desc()).first()
-    
-    if last_assigned:
-        # Get the last shloka's details (in c:Xv# format)
-        last_shloka_id = last_assigned.shloka_id
-        
-        # Parse the chapter and verse from the shloka ID
-        try:
-            if ':' in last_shloka_id and 'v' in last_shloka_id:
-                chapter_part, verse_part = last_shloka_id.split(':')
-                chapter = int(verse_part.split('v')[0])  
-                verse = int(verse_part.split('v')[1])
-                
-                # Get the next 5 shlokas in sequence
-                next_shlokas = []
-                current_chapter = chapter
-                current_verse = verse + 1
-                
-                while len(next_shlokas) < 5:
-                    next_id = f"c:{current_chapter}v{current_verse}"
-                    next_shloka = Shloka.query.get(next_id)
-                    
-                    if next_shloka:
-                        next_shlokas.append(next_shloka)
-                        current_verse += 1
-                    else:
-                        # Move to the next chapter
-                        current_chapter += 1
-                        current_verse = 1
-                        # If we've gone through all chapters, start from the beginning
-                        if current_chapter > 18:  # There are 18 chapters in Bhagavad Gita
-                            current_chapter = 1
-                
-                if next_shlokas:
-                    selected_shlokas = next_shlokas
-                else:
-                    # Fallback to initial shlokas from chapter 1 if we couldn't find next ones
-                    selected_shlokas = get_initial_shlokas(5)
-            else:
-                # If ID format is not as expected, start from the beginning
-                selected_shlokas = get_initial_shlokas(5)
-        except Exception as e:
-            # If any error in parsing, use initial shlokas
-            print(f"Error parsing shloka ID: {e}, falling back to chapter 1")
-            selected_shlokas = get_initial_shlokas(5)
-    else:
-        # If no previous shlokas assigned, start from chapter 1
-        selected_shlokas = get_initial_shlokas(5)
-    
-    print(f"Selected shlokas for visitor {visitor_id}: {[s.id for s in selected_shlokas]}")
-    
-    # Save the selected shlokas for this visitor for today
-    selected_ids = [s.id for s in selected_shlokas]
-    for shloka_id in selected_ids:
-        visitor_shloka = VisitorShloka(
-            visitor_id=visitor_id,
-            shloka_id=shloka_id,
-            date=today
-        )
-        db.session.add(visitor_shloka)
-    
-    # Update visitor's last shloka date
-    visitor = Visitor.query.get(visitor_id)
-    if visitor:
-        visitor.last_shloka_date = today
+    corpus = get_corpus()
+    
+    # Return the shlokas already assigned today, in the order they were given
+    if visitor.last_shloka_date == today:
+        assigned_ids = db.session.scalars(
+            db.select(VisitorShloka.shloka_id)
+            .filter_by(visitor_id=visitor.id, date=today)
+            .order_by(VisitorShloka.id)
+        ).all()
+        if assigned_ids:
+            return [corpus[i] for i in assigned_ids if i in corpus]
+    
+    # Continue in reading order after the visitor's cursor, wrapping
+    # back to chapter 1 after the final chapter
+    cursor = visitor.shloka_cursor
+    if cursor is None and visitor.last_shloka_date is not None:
+        cursor = _last_assigned_ordinal(visitor.id, corpus)
+    selected_shlokas = corpus.next_after(cursor if cursor is not None else -1, DAILY_SHLOKA_COUNT)
+    if not selected_shlokas:
+        return []
+    
+    app.logger.debug("Assigned daily shlokas", extra={
+        'visitor_id': visitor.id,
+        'shloka_ids': [s.id for s in selected_shlokas]
+    })
+    
+    # Save the selected shlokas for this visitor for today in one statement.
+    # A concurrent request computes the same run, so its rows are ignored.
+    db.session.execute(
+        dialect_insert(VisitorShloka).on_conflict_do_nothing(
+            index_elements=['visitor_id', 'date', 'shloka_id']
+        ),
+        [{'visitor_id': visitor.id, 'shloka_id': s.id, 'date': today} for s in selected_shlokas]
+    )
     
     # Create daily progress for today if not exists
-    progress = DailyProgress.query.filter_by(
-        visitor_id=visitor_id,
-        date=today
-    ).first()
-    
-    if not progress:
-        progress = DailyProgress(
-            visitor_id=visitor_id,
-            date=today,
-            completed=False
+    db.session.execute(
+        dialect_insert(DailyProgress)
+        .values(visitor_id=visitor.id, date=today, completed=False)
+        .on_conflict_do_nothing(index_elements=['visitor_id', 'date'])
+    )
+    
+    # Advance the visitor's cursor past today's shlokas, unless a concurrent
+    # request already has
+    db.session.execute(
+        db.update(Visitor)
+        .where(
+            Visitor.id == visitor.id,
+            db.or_(Visitor.last_shloka_date.is_(None), Visitor.last_shloka_date < today)
         )
-        db.session.add(progress)
+        .values(last_shloka_date=today, shloka_cursor=selected_shlokas[-1].ordinal)
+        .execution_options(synchronize_session='evaluate')
+    )
     
     db.session.commit()
     
     return selected_shlokas
 
-def mark_daily_progress_complete(visitor_id):
-    """Mark the daily progress as complete"""
+def _last_assigned_ordinal(visitor_id, corpus):
+    """Derive the cursor from history for visitors assigned shlokas before it was stored"""
+    last_date = db.session.query(db.func.max(VisitorShloka.date)).filter(
+        VisitorShloka.visitor_id == visitor_id
+    ).scalar_subquery()
+    last_day_shlokas = corpus.get_many(
+        vs.shloka_id for vs in VisitorShloka.query.filter(
+            VisitorShloka.visitor_id == visitor_id,
+            VisitorShloka.date == last_date
+        )
+    )
+    return _run_end(last_day_shlokas, corpus)
+
+def last_assigned_ordinals(visitors, corpus):
+    """Derive cursors for many visitors assigned shlokas before the cursor was stored.
+    
+    visitors are (visitor id, last shloka date) pairs; one query covers them
+    all. Returns a dict of visitor id to ordinal.
+    """
+    last_dates = dict(visitors)
+    if not last_dates:
+        return {}
+    shloka_ids = {}
+    rows = db.session.execute(
+        db.select(VisitorShloka.visitor_id, VisitorShloka.date, VisitorShloka.shloka_id)
+        .where(VisitorShloka.visitor_id.in_(last_dates))
+        .where(VisitorShloka.date.in_(set(last_dates.values())))
+    )
+    for visitor_id, day, shloka_id in rows:
+        if last_dates[visitor_id] == day:
+            shloka_ids.setdefault(visitor_id, []).append(shloka_id)
+    return {
+        visitor_id: _run_end(corpus.get_many(ids), corpus)
+        for visitor_id, ids in shloka_ids.items()
+    }
+
+def _run_end(day_shlokas, corpus):
+    """Ordinal of the last verse of one day's consecutive run, or None if there was no run"""
+    if not day_shlokas:
+        return None
+    
+    # The end of the run is the verse whose successor wasn't assigned with it
+    ordinals = {s.ordinal for s in day_shlokas}
+    for s in day_shlokas:
+        if (s.ordinal + 1) % len(corpus) not in ordinals:
+            return s.ordinal
+    return day_shlokas[-1].ordinal
+
+def preview_daily_shlokas(shloka_cursor, last_shloka_date, corpus, today=None):
+    """Work out a visitor's shlokas for today from their cursor, without touching the database.
+    
+    Gives the same run get_daily_shlokas assigns (or already assigned today),
+    so it can be used for many visitors at once, e.g. in notification emails.
+    """
+    today = today or date.today()
+    if shloka_cursor is None:
+        return corpus.next_after(-1, DAILY_SHLOKA_COUNT)
+    if last_shloka_date == today:
+        # Today's run ends at the cursor
+        return corpus.next_after(shloka_cursor - DAILY_SHLOKA_COUNT, DAILY_SHLOKA_COUNT)
+    return corpus.next_after(shloka_cursor, DAILY_SHLOKA_COUNT)
+
+def mark_daily_progress_complete(visitor, reviewed=()):
+    """Mark today's progress as complete and bump the visitor's state version.
+    
+    reviewed are the ids of the review cards shown with today's shlokas;
+    those still due are rescheduled, so they leave the review queue. Returns (today, weekly summary, (current, longest) streak) as of the
+    change, built from what the writes return rather than read back after
+    the commit.
+    """
     today = date.today()
     
-    # Find the daily progress for today
-    progress = DailyProgress.query.filter_by(
-        visitor_id=visitor_id,
-        date=today
-    ).first()
-    
-    if not progress:
-        progress = DailyProgress(
-            visitor_id=visitor_id,
-            date=today,
-            completed=True
+    # Create or complete today's progress in a single upsert
+    db.session.execute(
+        dialect_insert(DailyProgress)
+        .values(visitor_id=visitor.id, date=today, completed=True)
+        .on_conflict_do_update(
+            index_elements=['visitor_id', 'date'],
+            set_={'completed': True}
         )
-        db.session.add(progress)
-    else:
-        progress.completed = True
+    )
+    
+    # Keep the compact history and streak counters up to date, in the same
+    # UPDATE as the state version
+    year, state = record_completion(
+        visitor.id, today,
+        returning=(_quiz_taken(visitor.id, today).label('quiz_taken'),),
+        state_version=Visitor.state_version + 1
+    )
+    if reviewed:
+        record_reviews(visitor.id, {shloka_id: REVIEWED_QUALITY for shloka_id in reviewed}, today, due_only=True)
+    
+    completed = completed_days(year)
+    start_date = today - timedelta(days=6)
+    if start_date.year != today.year:
+        # In early January the last 7 days reach into last year's bitmap
+        previous = db.session.scalars(
+            db.select(ProgressYear).filter_by(visitor_id=visitor.id, year=start_date.year)
+        ).first()
+        if previous:
+            completed |= completed_days(previous)
     
     db.session.commit()
-    return progress
+    return today, _weekly_summary(completed, bool(state.quiz_taken), today), streaks(state, today)
 
-def get_weekly_progress(visitor_id):
-    """Get the visitor's progress for the past 7 days"""
+def get_favorite_ids(visitor_id, shloka_ids=None):
+    """Get the set of shloka ids the visitor has favorited, in one query.
+    
+    Pass shloka_ids to only check those shlokas.
+    """
+    query = db.select(Favorite.shloka_id).where(Favorite.visitor_id == visitor_id)
+    if shloka_ids is not None:
+        shloka_ids = list(shloka_ids)
+        if not shloka_ids:
+            return set()
+        query = query.where(Favorite.shloka_id.in_(shloka_ids))
+    return set(db.session.scalars(query))
+
+def _quiz_taken(visitor_id, today):
+    """Whether the visitor has already taken the quiz this week, as a column expression"""
+    start_of_week = today - timedelta(days=today.weekday())
+    return db.select(Quiz.id).where(
+        Quiz.visitor_id == visitor_id,
+        Quiz.date >= start_of_week,
+        Quiz.date <= today
+    ).exists()
+
+def get_weekly_summary(visitor_id):
+    """Get the visitor's progress for the past 7 days and whether the weekly quiz is unlocked.
+    
+    Everything comes from a single query reading the completion bitmaps of
+    the one or two years the last 7 days fall in; the current week (Monday
+    onwards) is always among those days.
+    """
     today = date.today()
     start_date = today - timedelta(days=6)  # Get the last 7 days
     
+    rows = db.session.execute(
+        db.select(ProgressYear, _quiz_taken(visitor_id, today).label('quiz_taken'))
+        .where(
+            ProgressYear.visitor_id == visitor_id,
+            ProgressYear.year.in_({start_date.year, today.year})
+        )
+    ).all()
+    completed = set()
+    for row in rows:
+        completed |= completed_days(row.ProgressYear)
+    
+    # Without any bitmap rows there is no quiz_taken value, but the quiz
+    # can't be unlocked then anyway
+    return _weekly_summary(completed, bool(rows) and bool(rows[0].quiz_taken), today)
+
+def _weekly_summary(completed, has_quiz, today):
+    """Summarize the last 7 days from the set of completed dates"""
+    start_date = today - timedelta(days=6)
+    start_of_week = today - timedelta(days=today.weekday())
+    
     progress_data = []
     for i in range(7):
         current_date = start_date + timedelta(days=i)
-        
-        # Find progress for this date
-        progress = DailyProgress.query.filter_by(
-            visitor_id=visitor_id,
-            date=current_date
-        ).first()
-        
         progress_data.append({
             'date': current_date.strftime('%Y-%m-%d'),
-            'completed': progress.completed if progress else False,
+            'completed': current_date in completed,
             'is_today': current_date == today
         })
     
-    return progress_data
-
-def is_quiz_unlocked(visitor_id):
-    """Check if the weekly quiz is unlocked for the visitor"""
-    today = date.today()
-    start_of_week = today - timedelta(days=today.weekday())
-    
     # Count completed days in this week
-    completed_days = DailyProgress.query.filter(
-        DailyProgress.visitor_id == visitor_id,
-        DailyProgress.date >= start_of_week,
-        DailyProgress.date <= today,
-        DailyProgress.completed == True
-    ).count()
-    
-    # Check if visitor has already taken the quiz this week
-    quiz = Quiz.query.filter(
-        Quiz.visitor_id == visitor_id,
-        Quiz.date >= start_of_week,
-        Quiz.date <= today
-    ).first()
+    completed_this_week = sum(1 for day in completed if start_of_week <= day <= today)
     
     # Quiz is unlocked if visitor has completed at least 5 days and hasn't taken the quiz yet
     # Relaxed from 7 days to 5 days to make it more accessible
-    return completed_days >= 5 and not quiz
+    return {
+        'progress': progress_data,
+        'completed_days': completed_this_week,
+        'quiz_taken': has_quiz,
+        'quiz_unlocked': completed_this_week >= 5 and not has_quiz
+    }
 
-def generate_weekly_quiz(visitor_id):
-    """Generate a weekly quiz for the visitor"""
+def generate_weekly_quiz(visitor_id, rng=None, reviews=()):
+    """Generate a weekly quiz for the visitor
+    
+    reviews are verses due for spaced-repetition review (see
+    get_due_reviews); they are asked first, alongside this week's shlokas.
+    Pass a seeded random.Random as rng to get a reproducible quiz.
+    """
+    rng = rng or random.Random()
     today = date.today()
     start_of_week = today - timedelta(days=today.weekday())
     
     # Get all shlokas from this week
-    visitor_shlokas = VisitorShloka.query.filter(
-        VisitorShloka.visitor_id == visitor_id,
-        VisitorShloka.date >= start_of_week,
-        VisitorShloka.date <= today
+    week_shloka_ids = db.session.scalars(
+        db.select(VisitorShloka.shloka_id).where(
+            VisitorShloka.visitor_id == visitor_id,
+            VisitorShloka.date >= start_of_week,
+            VisitorShloka.date <= today
+        )
     ).all()
     
-    shloka_ids = [vs.shloka_id for vs in visitor_shlokas]
-    shlokas = Shloka.query.filter(Shloka.id.in_(shloka_ids)).all()
+    corpus = get_corpus()
+    shlokas = corpus.get_many(week_shloka_ids)
     
     # Create quiz
     quiz = Quiz(
@@ -226,20 +378,22 @@ def generate_weekly_quiz(visitor_id):
     db.session.add(quiz)
     db.session.flush()  # Get the quiz ID
     
-    # Generate 7 questions (or less if not enough shlokas)
-    num_questions = min(7, len(shlokas))
-    question_shlokas = random.sample(shlokas, num_questions) if num_questions > 0 else []
+    # Generate 7 questions (or less if not enough shlokas), due reviews first
+    week_ids = {s.id for s in shlokas}
+    question_shlokas = [s for s in reviews if s.id not in week_ids][:7]
+    num_questions = min(7 - len(question_shlokas), len(shlokas))
+    question_shlokas += rng.sample(shlokas, num_questions) if num_questions > 0 else []
     
     # If we don't have enough shlokas from this week, add some random ones
-    if num_questions < 5:
-        additional_needed = 5 - num_questions
-        existing_ids = [s.id for s in question_shlokas]
-        additional_shlokas = Shloka.query.filter(
-            ~Shloka.id.in_(existing_ids)
-        ).order_by(db.func.random()).limit(additional_needed).all()
+    if len(question_shlokas) < 5:
+        additional_needed = 5 - len(question_shlokas)
+        existing_ids = {s.id for s in question_shlokas}
+        candidates = [s for s in corpus if s.id not in existing_ids]
+        additional_shlokas = rng.sample(candidates, min(additional_needed, len(candidates)))
         
         question_shlokas.extend(additional_shlokas)
     
+    questions = []
     for i, shloka in enumerate(question_shlokas):
         # Alternate between Sanskrit to English and English to Sanskrit questions
         question_type = 'sanskrit_to_english' if i % 2 == 0 else 'english_to_sanskrit'
@@ -247,83 +401,222 @@ def generate_weekly_quiz(visitor_id):
         # Get incorrect options (3 other random shlokas)
         other_shlokas = [s for s in shlokas if s.id != shloka.id]
         if len(other_shlokas) >= 3:
-            incorrect_options = random.sample(other_shlokas, 3)
+            incorrect_options = rng.sample(other_shlokas, 3)
         else:
-            # If not enough shlokas, use all available ones and supplement with more
-            all_other_shlokas = Shloka.query.filter(
-                Shloka.id != shloka.id
-            ).order_by(db.func.random()).limit(10).all()
-            incorrect_options = random.sample(all_other_shlokas, min(3, len(all_other_shlokas)))
+            # If not enough shlokas this week, use the precomputed distractor pool
+            incorrect_options = corpus.distractors.sample(shloka, 3, rng)
         
-        # Create options
-        if question_type == 'sanskrit_to_english':
-            correct_answer = shloka.english
-            options = [s.english for s in incorrect_options] + [shloka.english]
-        else:
-            correct_answer = shloka.sanskrit
-            options = [s.sanskrit for s in incorrect_options] + [shloka.sanskrit]
+        # Options are stored as shloka ids; their text is resolved from the corpus when shown
+        options = [s.id for s in incorrect_options] + [shloka.id]
         
         # Shuffle options
-        random.shuffle(options)
+        rng.shuffle(options)
         
-        # Create question
-        question = QuizQuestion(
-            quiz_id=quiz.id,
-            shloka_id=shloka.id,
-            question_type=question_type,
-            correct_answer=correct_answer,
-            options=json.dumps(options)
-        )
-        db.session.add(question)
+        questions.append({
+            'quiz_id': quiz.id,
+            'shloka_id': shloka.id,
+            'question_type': question_type,
+            'correct_answer': shloka.id,
+            'options': json.dumps(options)
+        })
     
+    # Insert all questions in one statement
+    quiz_id = quiz.id
+    if questions:
+        db.session.execute(db.insert(QuizQuestion), questions)
     db.session.commit()
-    return quiz
+    
+    # Reload the quiz with its questions in a single query
+    return db.session.execute(
+        db.select(Quiz)
+        .options(joinedload(Quiz.questions))
+        .where(Quiz.id == quiz_id)
+    ).unique().scalar_one()
 
-def submit_quiz_answers(quiz_id, answers):
-    """Submit answers for a quiz and calculate score"""
-    quiz = Quiz.query.get(quiz_id)
+def serialize_quiz_question(question, corpus):
+    """Build the API representation of a quiz question.
+    
+    Prompt and options are shloka ids; the page shows the Sanskrit or
+    English text of each, per question_type, from the corpus bundles.
+    """
+    # Keep the stored (shuffled) option order
+    options = [i for i in json.loads(question.options) if i in corpus]
+    
+    return {
+        'id': question.id,
+        'shloka_id': question.shloka_id,
+        'question_type': question.question_type,
+        'options': [{'id': shloka_id} for shloka_id in options]
+    }
+
+def submit_quiz_answers(quiz_id, answers, visitor):
+    """Submit answers for a quiz and calculate score
+    
+    Only the visitor's own quizzes can be submitted. Submitting a quiz that
+    is already completed returns it unchanged, without touching the visitor.
+    """
+    quiz = db.session.scalars(
+        db.select(Quiz)
+        .options(joinedload(Quiz.questions))
+        .where(Quiz.id == quiz_id, Quiz.visitor_id == visitor.id)
+    ).unique().first()
     if not quiz:
         return None
+    if quiz.completed:
+        return quiz
     
-    correct_count = 0
-    total_questions = len(quiz.questions)
-    
+    # Score in memory; answers map question ids to the chosen option's shloka id
+    questions = {q.id: q for q in quiz.questions}
+    results = []
     for question_id, answer in answers.items():
-        question = QuizQuestion.query.get(int(question_id))
-        if question and question.quiz_id == quiz.id:
-            question.user_answer = answer
-            question.is_correct = (answer == question.correct_answer)
-            if question.is_correct:
-                correct_count += 1
-    
+        try:
+            question = questions.get(int(question_id))
+        except (TypeError, ValueError):
+            continue
+        if question:
+            results.append({
+                'id': question.id,
+                'user_answer': answer,
+                'is_correct': answer == question.correct_answer
+            })
+    
+    correct_count = sum(1 for r in results if r['is_correct'])
+    total_questions = len(questions)
     score = int((correct_count / total_questions) * 100) if total_questions > 0 else 0
-    quiz.score = score
-    quiz.completed = True
     
-    # Update visitor's last quiz info
-    visitor = Visitor.query.get(quiz.visitor_id)
-    if visitor:
-        visitor.last_quiz_date = quiz.date
-        visitor.last_quiz_score = score
+    # Complete the quiz only if no concurrent submission already did
+    completed = db.session.execute(
+        db.update(Quiz)
+        .where(Quiz.id == quiz.id, Quiz.completed.is_not(True))
+        .values(score=score, completed=True)
+        .execution_options(synchronize_session='evaluate')
+    )
+    if completed.rowcount == 0:
+        db.session.rollback()
+        return db.session.get(Quiz, quiz.id)
+    
+    if results:
+        db.session.execute(db.update(QuizQuestion), results)
+        record_reviews(visitor.id, {
+            questions[r['id']].shloka_id: grade(r['is_correct']) for r in results
+        }, date.today())
+    
+    # Update visitor's last quiz info, in the same UPDATE as the state version
+    visitor.bump_state_version()
+    visitor.last_quiz_date = quiz.date
+    visitor.last_quiz_score = score
     
     db.session.commit()
     return quiz
 
-def get_initial_shlokas(count=5):
-    """Get sequential shlokas for non-authenticated users, starting from chapter 1"""
-    # For the landing page, always start from the beginning of chapter 1
-    # Get the first 5 consecutive verses from chapter 1 
-    shlokas = []
+def record_reviews(visitor_id, qualities, today, due_only=False):
+    """Reschedule the reviews of shlokas; qualities maps shloka ids to SM-2 recall grades (0-5).
+    
+    With due_only, shlokas that have no review state or aren't due yet are
+    left alone.
+    """
+    existing = {
+        row.shloka_id: row for row in db.session.execute(
+            db.select(ReviewState.shloka_id, ReviewState.easiness, ReviewState.interval,
+                      ReviewState.repetitions, ReviewState.due_date)
+            .where(ReviewState.visitor_id == visitor_id, ReviewState.shloka_id.in_(qualities))
+        )
+    }
+    if due_only:
+        qualities = {
+            shloka_id: quality for shloka_id, quality in qualities.items()
+            if shloka_id in existing and existing[shloka_id].due_date <= today
+        }
+        if not qualities:
+            return
     
-    for i in range(1, count + 1):
-        shloka_id = f"c:1v{i}"
-        shloka = Shloka.query.get(shloka_id)
-        if shloka:
-            shlokas.append(shloka)
+    rows = []
+    for shloka_id, quality in qualities.items():
+        state = existing.get(shloka_id)
+        easiness, interval, repetitions, due_date = schedule(
+            state.easiness if state else INITIAL_EASINESS,
+            state.interval if state else 0,
+            state.repetitions if state else 0,
+            quality,
+            today
+        )
+        rows.append({
+            'visitor_id': visitor_id,
+            'shloka_id': shloka_id,
+            'easiness': easiness,
+            'interval': interval,
+            'repetitions': repetitions,
+            'due_date': due_date,
+            'last_reviewed': today
+        })
     
-    # If we somehow don't have enough shlokas, try a more general query
-    if len(shlokas) < count:
-        shlokas = Shloka.query.order_by(Shloka.id).limit(count).all()
+    # Insert new review states and update existing ones in one statement
+    insert = dialect_insert(ReviewState)
+    db.session.execute(
+        insert.on_conflict_do_update(
+            index_elements=['visitor_id', 'shloka_id'],
+            set_={column: insert.excluded[column] for column in
+                  ('easiness', 'interval', 'repetitions', 'due_date', 'last_reviewed')}
+        ),
+        rows
+    )
+
+def get_due_reviews(visitor, limit=DAILY_REVIEW_COUNT):
+    """Get the verses most overdue for review, read from the visitor's due-date index.
+    
+    Visitors who never finished a quiz have nothing to review and cost no query.
+    """
+    if visitor.last_quiz_date is None:
+        return []
+    due_ids = db.session.scalars(
+        db.select(ReviewState.shloka_id)
+        .where(ReviewState.visitor_id == visitor.id, ReviewState.due_date <= date.today())
+        .order_by(ReviewState.due_date, ReviewState.shloka_id)
+        .limit(limit)
+    ).all()
+    corpus = get_corpus()
+    return [corpus[i] for i in due_ids if i in corpus]
+
+def get_due_reviews_and_favorites(visitor, shloka_ids, limit=DAILY_REVIEW_COUNT):
+    """Get the verses due for review besides shloka_ids, and which of all of them the visitor has favorited.
+    
+    One query reads both: the favorites among shloka_ids, and the most
+    overdue review states with their own favorite flags. Returns (due
+    verses, set of favorite ids).
+    """
+    shloka_ids = list(shloka_ids)
+    if visitor.last_quiz_date is None:
+        return [], get_favorite_ids(visitor.id, shloka_ids)
+    
+    is_favorite = db.select(Favorite.id).where(
+        Favorite.visitor_id == visitor.id,
+        Favorite.shloka_id == ReviewState.shloka_id
+    ).exists()
+    due = (
+        db.select(ReviewState.shloka_id, ReviewState.due_date, is_favorite.label('is_favorite'))
+        .where(
+            ReviewState.visitor_id == visitor.id,
+            ReviewState.due_date <= date.today(),
+            ReviewState.shloka_id.not_in(shloka_ids)
+        )
+        .order_by(ReviewState.due_date, ReviewState.shloka_id)
+        .limit(limit)
+        .subquery()
+    )
+    favorites = db.select(Favorite.shloka_id, db.null(), db.true()).where(
+        Favorite.visitor_id == visitor.id,
+        Favorite.shloka_id.in_(shloka_ids)
+    )
+    rows = db.session.execute(db.union_all(db.select(due), favorites)).all()
     
-    print(f"Initial shlokas selected: {[s.id for s in shlokas]}")
-    return shlokas
+    corpus = get_corpus()
+    due_rows = sorted((row.due_date, row.shloka_id) for row in rows if row.due_date is not None)
+    favorite_ids = {row.shloka_id for row in rows if row.is_favorite}
+    return [corpus[i] for _, i in due_rows if i in corpus], favorite_ids
+
+@cached(ttl=3600, key=lambda count=5: f"{get_corpus().version}:{count}")
+def get_initial_shlokas(count=5):
+    """Get sequential shlokas for non-authenticated users, starting from chapter 1"""
+    # For the landing page, always start from the beginning of chapter 1
+    # The corpus is in reading order, so these are the first consecutive verses
+    return get_corpus().first(count)